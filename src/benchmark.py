@@ -0,0 +1,1355 @@
+import argparse
+import copy
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from luma.core.virtual import snapshot
+from PIL import Image
+
+from trains.config import Config
+
+# Offline configuration using the luma dummy device
+CONFIG = {
+    "settings": {
+        "departure": "PAD",
+        "services": 3,
+        "brightness": 255,
+        "powersaving": {
+            "start": "00:00",
+            "end": "00:00",
+        },
+        "messages": {
+            "frequency": 30,
+            "interval": 5,
+        },
+        "layout": {
+            "headcodes": False,
+            "times": False,
+        },
+    },
+    "debug": {
+        "dummy": True,
+        "preview": False,
+    },
+}
+
+def configure(**settings):
+    config = copy.deepcopy(CONFIG)
+    config["settings"].update(settings)
+    Config.load(config)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+STATIONS = [
+    ("PADTON", "London Paddington", "PAD"),
+    ("RDNGSTN", "Reading", "RDG"),
+    ("DIDCOTP", "Didcot Parkway", "DID"),
+    ("SWINDON", "Swindon", "SWI"),
+    ("CHIPNHM", "Chippenham", "CPM"),
+    ("BATHSPA", "Bath Spa", "BTH"),
+    ("BRSTLTM", "Bristol Temple Meads", "BRI"),
+    ("OXFD", "Oxford", "OXF"),
+    ("SLOUGH", "Slough", "SLO"),
+    ("MDNHEAD", "Maidenhead", "MAI"),
+    ("TWYFORD", "Twyford", "TWY"),
+    ("EALINGB", "Ealing Broadway", "EAL"),
+    ("HTRWAPT", "Heathrow Terminals 2 & 3", "HXX"),
+    ("NWBY", "Newbury", "NBY"),
+    ("CRDFCEN", "Cardiff Central", "CDF"),
+    ("NWPTRTG", "Newport (South Wales)", "NWP"),
+    ("EXETRSD", "Exeter St Davids", "EXD"),
+    ("PLYMTH", "Plymouth", "PLY"),
+    ("PENZNCE", "Penzance", "PNZ"),
+    ("WORCSFS", "Worcester Foregate Street", "WOF"),
+]
+
+# A board response in the same shape as ldb.prod.a51.li
+def build_fixture(departures=400, tiplocs=3000, calling=15, seed=1, cancelled_every=17, late_every=0, messages=0):
+    rng = random.Random(seed)
+    now = datetime.now().replace(second=0, microsecond=0)
+
+    tiploc_data = {}
+    for tiploc, name, crs in STATIONS[:tiplocs]:
+        tiploc_data[tiploc] = {"locname": name, "crs": crs, "toc": "GW"}
+    for i in range(len(tiploc_data), tiplocs):
+        tiploc_data["TPL{0:05d}".format(i)] = {"locname": "Station {0}".format(i), "toc": "GW"}
+        if i % 7:
+            tiploc_data["TPL{0:05d}".format(i)]["crs"] = "{0:03d}".format(i % 1000)
+    names = list(tiploc_data.keys())
+    station = tiploc_data[names[0]]
+
+    board = []
+    for i in range(departures):
+        departs = now + timedelta(minutes=i // 2)
+        origin = departs - timedelta(minutes=rng.randint(0, 120))
+        expected = departs
+        if late_every and i % late_every == 0:
+            expected += timedelta(minutes=rng.randint(2, 25))
+        stops = rng.sample(names[1:], min(calling, len(names) - 1))
+        cancelled = bool(cancelled_every) and i % cancelled_every == 0
+        board.append({
+            "rid": "2020{0:08d}".format(i),
+            "trainId": "1A{0:02d}".format(i % 100),
+            "toc": rng.choice(["GW", "XR", "HX"]),
+            "ssd": origin.strftime("%Y-%m-%d"),
+            "origin": {"tiploc": names[0], "timetable": {"time": origin.strftime("%H:%M:%S")}},
+            "dest": {"tiploc": stops[-1]},
+            "location": {
+                "timetable": {"time": departs.strftime("%H:%M:%S")},
+                "displaytime": departs.strftime("%H:%M:%S"),
+                "forecast": {"plat": {"plat": str(rng.randint(1, 14))}, "time": expected.strftime("%H:%M:%S"), "departed": False},
+                "length": str(rng.choice([4, 8, 12])),
+                "cancelled": cancelled,
+            },
+            "cancelReason": {"reason": 100 if cancelled else 0},
+            "lateReason": {"reason": 200 if expected != departs else 0},
+            "calling": [{"tpl": stop, "time": departs.strftime("%H:%M:%S")} for stop in stops],
+        })
+
+    return {
+        "station": [names[0]],
+        "departures": board,
+        "tiploc": tiploc_data,
+        "toc": {"GW": {"tocname": "Great Western Railway"}, "XR": {"tocname": "Elizabeth Line"}, "HX": {"tocname": "Heathrow Express"}},
+        "reasons": {"cancelled": {"100": {"reasontext": "a fault on this train"}}, "late": {"200": {"reasontext": "a signalling problem"}}},
+        "messages": [
+            {"station": [station.get("crs")], "message": "<p>{0} <a href=\"https://www.nationalrail.co.uk/\">Latest travel news</a>.</p>".format(DISRUPTION * (1 + i % 2))}
+            for i in range(messages)
+        ],
+    }
+
+# The scenarios we keep fixtures for
+SCENARIOS = {
+    "quiet": dict(departures=4, tiplocs=20, calling=4, cancelled_every=0),
+    "busy": dict(departures=250, tiplocs=1500, calling=12),
+    "disruption": dict(departures=0, tiplocs=20, messages=6),
+    "cancellations": dict(departures=30, tiplocs=200, calling=8, cancelled_every=2, late_every=3),
+}
+
+def load_fixture(args):
+    path = args.fixture
+    if path and not os.path.exists(path):
+        path = os.path.join(FIXTURES, "{0}.json".format(path))
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return build_fixture()
+
+# Time parsing a board response into a State
+def benchmark_parse(args):
+    from trains.api import Api
+
+    data = load_fixture(args)
+
+    # Filter on a destination served by few trains so every departure is checked
+    configure(destination="999")
+    api = Api()
+
+    runs = max(1, int(args.runs))
+    start = time.perf_counter()
+    for _ in range(runs):
+        api.parse_state(data)
+    elapsed = (time.perf_counter() - start) / runs
+
+    print("{0} departures, {1} TIPLOCs: {2:.2f} ms per parse".format(len(data["departures"]), len(data["tiploc"]), elapsed * 1000))
+
+# Allocations retained by, and peak memory of, a call
+def measure_allocations(fn):
+    tracemalloc.start()
+    tracemalloc.clear_traces()
+    result = fn()
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    return result, blocks, current, peak
+
+# Compare the parsed model against the old JSON round trip into dicts
+def benchmark_memory(args):
+    from trains.api import Api
+
+    data = load_fixture(args)
+    configure(services=len(data["departures"]))
+    api = Api()
+
+    as_dict = lambda state: json.loads(json.dumps(state, default=dict))
+    paths = {
+        "model": lambda: api.parse_state(data),
+        "json": lambda: as_dict(api.parse_state(data)),
+    }
+    for name, fn in paths.items():
+        _, blocks, current, peak = measure_allocations(fn)
+        print("{0:>6}: {1:8d} blocks, {2:8.1f} KiB retained, {3:8.1f} KiB peak".format(name, blocks, current / 1024, peak / 1024))
+
+def sample_state():
+    from trains.api import Api
+
+    return Api().parse_state(build_fixture(departures=20, tiplocs=200))
+
+def create_board(serial=None):
+    from trains.board import Board
+
+    board = Board(serial=serial)
+    board.departure_board()
+    board.update_state(sample_state())
+    return board
+
+# Compare CPU used by an unthrottled render loop with the deadline scheduler
+def benchmark_scheduler(args):
+    results = {}
+    for mode in ("busy", "scheduled"):
+        board = create_board()
+        frames = 0
+
+        end = time.monotonic() + args.seconds
+        cpu = time.process_time()
+        while time.monotonic() < end:
+            timestamp = datetime.now() + timedelta(seconds=10)
+            board.update_data(timestamp, frames)
+
+            if mode == "busy":
+                board.viewport.refresh()
+                frames += 1
+            else:
+                if board.render(timestamp, frames):
+                    frames += 1
+                board.scheduler.wait_until(min(board.get_deadline() or end, end))
+        cpu = time.process_time() - cpu
+
+        results[mode] = cpu
+        print("{0:>10}: {1:6d} frames, {2:8.2f} CPU seconds per hour".format(mode, frames, cpu * 3600 / args.seconds))
+
+    if results["scheduled"]:
+        print("{0:>10}: {1:.1f}x less CPU".format("saving", results["busy"] / results["scheduled"]))
+
+# Per-frame cost of the configuration reads made by the render loop
+def benchmark_config(args):
+    frames = 100000
+    reads = {
+        "lookup": lambda: (Config.get("debug.dummy"), Config.get("settings.layout.headcodes"), Config.get("settings.messages.interval")),
+        "compiled": lambda: (config.debug.dummy, config.settings.layout.headcodes, config.settings.messages.interval),
+    }
+
+    config = Config.snapshot()
+    for name, fn in reads.items():
+        start = time.perf_counter()
+        for _ in range(frames):
+            fn()
+        elapsed = time.perf_counter() - start
+        print("{0:>9}: {1:.3f} us per frame".format(name, elapsed * 1000000 / frames))
+
+# Bytes sent over SPI with full frame and dirty region updates, using a
+# serial interface that records the stream rather than a real display
+def benchmark_spi(args):
+    from trains.display import RecordingSerial
+
+    for partial in (False, True):
+        serial = RecordingSerial()
+        board = create_board(serial)
+        board.viewport.partial = partial
+        board.bus_rate()
+
+        frames = 0
+        end = time.monotonic() + args.seconds
+        while time.monotonic() < end:
+            timestamp = datetime.now() + timedelta(seconds=10)
+            board.update_data(timestamp, frames)
+            if board.render(timestamp, frames):
+                frames += 1
+            board.scheduler.wait_until(min(board.get_deadline() or end, end))
+
+        windows = sum(1 for kind, cmd in serial.stream if kind == "command" and cmd[0] == 0x5C)
+        print("{0:>8}: {1:5d} frames, {2:6d} windows, {3:10.0f} bytes/s".format("partial" if partial else "full", frames, windows, board.bus_rate()))
+
+# Text rendering through FreeType compared with blitting from the glyph atlas
+def benchmark_text(args):
+    from PIL import Image, ImageChops, ImageDraw
+    from trains.board import Board
+
+    texts = [
+        "Calling at: Reading, Didcot Parkway, Swindon, Chippenham, Bath Spa and Bristol Temple Meads",
+        "Great Western Railway service formed of 8 coaches",
+        "1st  12:34  4  Bristol Temple Meads  Exp 12:41",
+    ]
+    atlas = Board.load_font("Dot Matrix Regular.ttf", 10)
+    font = atlas.font
+
+    images = {}
+    renderers = {
+        "freetype": lambda image, text: ImageDraw.Draw(image).text((0, 0), text, font=font, fill=255),
+        "atlas": lambda image, text: atlas.draw(image, (0, 0), text),
+    }
+    for name, render in renderers.items():
+        images[name] = [Image.new("1", (atlas.getlength(text), 12)) for text in texts]
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            for image, text in zip(images[name], texts):
+                render(image, text)
+        elapsed = time.perf_counter() - start
+        print("{0:>9}: {1:8.0f} strings per second".format(name, args.runs * len(texts) / elapsed))
+
+    identical = all(not ImageChops.difference(a, b).getbbox() for a, b in zip(images["freetype"], images["atlas"]))
+    print("{0:>9}: {1}".format("identical", identical))
+
+DISRUPTION = (
+    "Disruption between Reading and Swindon. Due to a broken down train between Didcot Parkway and Swindon "
+    "all lines are blocked. Trains running between London Paddington and Bristol Temple Meads / Cardiff Central "
+    "may be cancelled, delayed by up to 60 minutes or revised. Disruption is expected until the end of the day. "
+    "Tickets will be accepted on Chiltern Railways, CrossCountry and South Western Railway services via any "
+    "reasonable route at no extra cost. "
+)
+
+# The previous word wrap, which re-measured the whole line after every word
+def quadratic_wordwrap(font, width, input):
+    words = input.split()
+    lines = []
+    line = ""
+
+    while words:
+        word = words.pop(0)
+        newline = line + " " + word
+        if font.getsize_multiline(newline.strip())[0] > width:
+            if line:
+                lines.append(line.strip())
+                line = word
+            else:
+                lines.append(newline.strip())
+                line = ""
+        else:
+            line = newline
+
+    if line:
+        lines.append(line.strip())
+    return lines
+
+# Wrapping and paginating long disruption messages
+def benchmark_wrap(args):
+    from trains.board import Board
+    from trains.utils import paginate, wordwrap
+
+    font = Board.load_font("Dot Matrix Regular.ttf", 10)
+    messages = [DISRUPTION * repeat for repeat in (1, 4, 16)]
+
+    for message in messages:
+        results = {}
+        for name, wrap in (("quadratic", quadratic_wordwrap), ("linear", wordwrap)):
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                results[name] = wrap(font, 256, message)
+            elapsed = (time.perf_counter() - start) / args.runs
+            print("{0:6d} chars {1:>10}: {2:8.3f} ms".format(len(message), name, elapsed * 1000))
+
+        paginate.cache_clear()
+        paginate(font, 256, message)
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            paginate(font, 256, message)
+        elapsed = (time.perf_counter() - start) / args.runs
+        print("{0:6d} chars {1:>10}: {2:8.3f} ms, same lines: {3}".format(len(message), "cached", elapsed * 1000, results["quadratic"] == results["linear"]))
+
+# Per-frame cost of the scrolling elements, counting PIL images created
+def benchmark_scroll(args):
+    from PIL import Image
+    from trains.board import Board
+    import trains.elements as elements
+
+    font = Board.load_font("Dot Matrix Regular.ttf", 10)
+    departures = sample_state()["departures"]
+    hotspots = {
+        "ScrollingText": elements.ScrollingText(214, 12, font, "1", text=DISRUPTION),
+        "NextService": elements.NextService(font, "1", departures[0]),
+        "RemainingServices": elements.RemainingServices(font, "1", departures[1:5]),
+    }
+
+    created = [0]
+    new = Image.Image._new
+    def counting_new(self, im):
+        created[0] += 1
+        return new(self, im)
+
+    image = Image.new("1", (256, 64))
+    for name, hotspot in hotspots.items():
+        created[0] = 0
+        Image.Image._new = counting_new
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                hotspot.paste_into(image, (0, 0))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            Image.Image._new = new
+
+        print("{0:>17}: {1:7.1f} us per frame, {2:4.2f} images per frame, {3:6d} bytes peak".format(name, elapsed * 1000000 / args.runs, created[0] / args.runs, peak))
+
+def fixture_paths(args):
+    if args.fixture:
+        path = args.fixture
+        if not os.path.exists(path):
+            path = os.path.join(FIXTURES, "{0}.json".format(path))
+        return [path]
+    return [os.path.join(FIXTURES, "{0}.json".format(name)) for name in sorted(SCENARIOS.keys())]
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def time_per_run(fn, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        fn()
+    return (time.perf_counter() - start) / runs
+
+# Parse, frame, element and allocation timings for each recorded fixture
+def benchmark_suite(args):
+    from PIL import Image
+    from trains.api import Api
+    from trains.board import Board
+
+    runs = max(1, int(args.runs))
+    results = {"revision": revision(), "runs": runs, "fixtures": {}}
+
+    for path in fixture_paths(args):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as f:
+            data = json.load(f)
+
+        # Go through get_state as the board would, but without the network
+        configure()
+        api = Api()
+        payload = json.dumps(data).encode()
+        api.download = lambda url: payload
+
+        # Forget the last response, or we'd skip parsing it again
+        def parse():
+            api.reset()
+            return api.get_state()
+        parse()
+
+        state, blocks, current, peak = measure_allocations(parse)
+        result = {
+            "parse_ms": time_per_run(parse, runs) * 1000,
+            "parse_blocks": blocks,
+            "parse_peak_kib": peak / 1024,
+            "unchanged_ms": time_per_run(api.get_state, runs) * 1000,
+        }
+
+        board = Board()
+        board.departure_board()
+        board.update_state(state)
+        board.update_data(datetime.now() + timedelta(seconds=10), 0)
+
+        # Every scene we'd show for this response, with its elements drawn
+        # whether or not they're due
+        scene = board.departureboard if state["departures"] else board.noservices
+        image = Image.new(board.device.mode, board.device.size)
+        elements = {}
+        for scene_name, shown in (("clock", board.clock), (type(scene).__name__, scene)):
+            frame = 0
+            for element in shown.get_elements():
+                if not element.added:
+                    continue
+                paste = lambda: element.hotspot.paste_into(image, element.location)
+                elapsed = time_per_run(paste, runs)
+                elements["{0}.{1}".format(scene_name, element.code)] = elapsed * 1000000
+                frame += elapsed
+            result["{0}_frame_us".format(scene_name)] = frame * 1000000
+        result["elements_us"] = elements
+
+        refresh = lambda: board.viewport.refresh(force=True)
+        result["refresh_ms"] = time_per_run(refresh, runs) * 1000
+        _, blocks, _, peak = measure_allocations(refresh)
+        result["refresh_blocks"] = blocks
+        result["refresh_peak_kib"] = peak / 1024
+
+        results["fixtures"][name] = result
+        print_suite_result(name, data, result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare_suite(json.load(f), results)
+
+def print_suite_result(name, data, result):
+    print("{0} ({1} departures, {2} messages)".format(name, len(data["departures"] or ()), len(data.get("messages") or ())))
+    print("  {0:>32}: {1:8.3f} ms, {2:6d} blocks, {3:8.1f} KiB peak".format("parse", result["parse_ms"], result["parse_blocks"], result["parse_peak_kib"]))
+    print("  {0:>32}: {1:8.3f} ms".format("unchanged", result["unchanged_ms"]))
+    print("  {0:>32}: {1:8.3f} ms, {2:6d} blocks, {3:8.1f} KiB peak".format("refresh", result["refresh_ms"], result["refresh_blocks"], result["refresh_peak_kib"]))
+    for key in sorted(result.keys()):
+        if key.endswith("_frame_us"):
+            print("  {0:>32}: {1:8.1f} us".format(key[:-len("_frame_us")] + " frame", result[key]))
+    for element, elapsed in sorted(result["elements_us"].items()):
+        print("  {0:>32}: {1:8.1f} us".format(element, elapsed))
+
+# Print how each timing changed against a previous --json run
+def compare_suite(before, after):
+    print("Compared with {0}".format(before.get("revision") or "previous run"))
+    for name, result in after["fixtures"].items():
+        previous = before["fixtures"].get(name)
+        if not previous:
+            continue
+
+        timings = dict((key, value) for key, value in result.items() if key.endswith("_ms") or key.endswith("_us"))
+        timings.update(result["elements_us"])
+        old = dict((key, value) for key, value in previous.items() if key.endswith("_ms") or key.endswith("_us"))
+        old.update(previous["elements_us"])
+
+        for key in sorted(timings.keys()):
+            if key == "elements_us" or not old.get(key):
+                continue
+            print("  {0:>14} {1:>32}: {2:+7.1f}%".format(name, key, (timings[key] - old[key]) * 100 / old[key]))
+
+# Write the synthetic fixtures, in the same shape as a recorded response
+def benchmark_generate(args):
+    os.makedirs(FIXTURES, exist_ok=True)
+    for name, scenario in SCENARIOS.items():
+        path = os.path.join(FIXTURES, "{0}.json".format(name))
+        with open(path, "w") as f:
+            json.dump(build_fixture(**scenario), f, separators=(",", ":"))
+        print("Wrote {0}".format(path))
+
+# Record the live response for the configured station as a fixture
+def benchmark_record(args):
+    from trains.api import Api
+
+    if not args.fixture:
+        raise SystemExit("--fixture is needed to name the recording")
+
+    # Uses this device's real configuration
+    api = Api()
+    departure = api.config.settings.departure
+    url = api.get_url()
+
+    path = args.fixture
+    if not path.endswith(".json"):
+        path = os.path.join(FIXTURES, "{0}.json".format(path))
+    with open(path, "w") as f:
+        json.dump(api.get_from_nrea(url), f, separators=(",", ":"))
+    print("Recorded {0} to {1}".format(departure, path))
+
+# A stand-in for the board API, serving a fixture from a local server. It
+# can compress the response and answer conditional requests.
+def serve_fixture(data, delay=0, compress=False, etag=False):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import gzip
+    import hashlib
+    import threading
+
+    body = json.dumps(data).encode()
+    compressed = gzip.compress(body)
+    tag = '"{0}"'.format(hashlib.sha1(body).hexdigest())
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            server.connections += 1
+            super(Handler, self).setup()
+
+        def do_GET(self):
+            server.requests += 1
+            time.sleep(server.delay)
+            if etag and self.headers.get("If-None-Match") == tag:
+                self.send_response(304)
+                self.send_header("ETag", tag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            content = body
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                content = compressed
+                self.send_header("Content-Encoding", "gzip")
+            if etag:
+                self.send_header("ETag", tag)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def log_message(self, *args):
+            return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.requests = 0
+    server.delay = delay
+    server.handle_error = lambda request, address: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def fixture_url(server):
+    return "http://127.0.0.1:{0}/boards/PAD".format(server.server_address[1])
+
+# Bytes downloaded and parses avoided when the board hasn't changed, with a
+# server that compresses and answers conditional requests, and one that doesn't
+def benchmark_conditional(args):
+    from trains.api import Api
+
+    data = load_fixture(args)
+    for name, compress, etag in (("plain", False, False), ("gzip", True, False), ("gzip+etag", True, True)):
+        server = serve_fixture(data, compress=compress, etag=etag)
+        config = copy.deepcopy(CONFIG)
+        config["debug"]["url"] = fixture_url(server)
+        Config.load(config)
+
+        api = Api()
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            api.get_state()
+        elapsed = (time.perf_counter() - start) / args.runs
+        server.shutdown()
+        api.close()
+
+        print("{0:>10}: {1:8.0f} bytes per fetch, {2:7.2f} ms per fetch, {3:3d} parses, {4:3d} avoided, {5:3d} not modified".format(
+            name, api.downloaded / args.runs, elapsed * 1000, api.parses, api.parses_avoided, api.not_modified))
+
+# Fetch latency, connection reuse and schedule drift of the fetcher against
+# a local server, then with the server hanging past the read timeout
+def benchmark_fetch(args):
+    from trains.api import Api
+    from trains.fetcher import Fetcher
+
+    data = load_fixture(args)
+    frequency = 1.0
+
+    for name, delay in (("responsive", 0), ("hung", 2)):
+        server = serve_fixture(data, delay)
+        config = copy.deepcopy(CONFIG)
+        config["debug"].update({"url": fixture_url(server), "connect_timeout": 0.5, "read_timeout": 0.5})
+        Config.load(config)
+
+        fetched = []
+        fetcher = Fetcher(Api(), frequency, lambda state: fetched.append(time.monotonic()), lambda ex: fetched.append(time.monotonic()))
+        fetcher.start()
+        time.sleep(args.seconds)
+        start = time.monotonic()
+        fetcher.stop(timeout=5)
+        stopped = time.monotonic() - start
+        server.shutdown()
+
+        # How far each fetch finished from where it was due
+        drift = [abs(at - fetched[0] - i * frequency) for i, at in enumerate(fetched)]
+        stats = fetcher.stats
+        print("{0:>10}: {1:4d} fetches, {2:4d} errors, {3:3d} connections, {4:7.1f} ms average, {5:7.1f} ms slowest, {6:6.1f} ms drift, {7:6.1f} ms to stop".format(
+            name, stats.fetches, stats.errors, server.connections, stats.average() * 1000, stats.slowest * 1000, max(drift, default=0) * 1000, stopped * 1000))
+
+# A simulated day at a station: trains every 10 minutes from 06:00, every 5
+# in the peaks, a morning of growing delays and platform changes, and an
+# API outage after lunch
+def simulated_board(minute):
+    from trains.data import Departure, State
+
+    timetable = [m for m in range(6 * 60, 24 * 60, 5) if m % 10 == 0 or 7 * 60 <= m < 9 * 60 or 16 * 60 <= m < 19 * 60]
+
+    departures = []
+    for scheduled in timetable:
+        delay = 0
+        platform = "1"
+        if 8 * 60 <= scheduled < 10 * 60:
+            delay = max(0, min(minute, scheduled) - 8 * 60) // 6
+            platform = "2" if (minute // 15) % 2 else "1"
+
+        if scheduled + delay < minute:
+            continue
+
+        departures.append(Departure(
+            rid=str(scheduled),
+            scheduled="{0:02d}:{1:02d}".format(scheduled // 60, scheduled % 60),
+            actual="{0:02d}:{1:02d}".format((scheduled + delay) // 60 % 24, (scheduled + delay) % 60),
+            platform=platform,
+        ))
+        if len(departures) == 3:
+            break
+
+    return State(name="Simulated", departures=tuple(departures))
+
+# Requests made and how stale the board got over a simulated day, with a
+# fixed polling frequency and with the adaptive policy
+def benchmark_polling(args):
+    import random
+    from trains.polling import PollingPolicy
+
+    boards = {}
+    def board_at(seconds):
+        minute = int(seconds // 60)
+        if minute not in boards:
+            boards[minute] = simulated_board(minute)
+        return boards[minute]
+
+    outage = (13 * 3600, 13 * 3600 + 20 * 60)
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    for adaptive in (False, True):
+        config = copy.deepcopy(CONFIG)
+        config["settings"]["powersaving"] = {"start": "01:00", "end": "06:00"}
+        config["debug"]["adaptive"] = adaptive
+        Config.load(config)
+        policy = PollingPolicy(Config.snapshot(), random.Random(1))
+
+        # Poll through the day, noting what the board showed after each fetch
+        polls = []
+        errors = 0
+        seconds = 37
+        while seconds < 24 * 3600:
+            if outage[0] <= seconds < outage[1]:
+                policy.record_error()
+                errors += 1
+            else:
+                policy.record(board_at(seconds))
+                polls.append((seconds, board_at(seconds)))
+            seconds += policy.interval(day + timedelta(seconds=seconds))
+
+        # Every 15 seconds, compare what we'd show with the live board
+        stale = 0
+        longest = 0
+        run = 0
+        shown = None
+        index = 0
+        for seconds in range(0, 24 * 3600, 15):
+            while index < len(polls) and polls[index][0] <= seconds:
+                shown = polls[index][1]
+                index += 1
+
+            if shown != board_at(seconds):
+                stale += 15
+                run += 15
+                longest = max(longest, run)
+            else:
+                run = 0
+
+        print("{0:>8}: {1:5d} requests, {2:3d} failed, {3:6.1f} stale minutes, {4:5.1f} minutes stale at most".format(
+            "adaptive" if adaptive else "fixed", len(polls) + errors, errors, stale / 60, longest / 60))
+
+# Decoding the whole response then sorting every departure, compared with
+# streaming it and keeping only the departures we'll show
+def benchmark_stream(args):
+    from trains.api import Api
+    from trains.stream import iter_chunks
+
+    paths = fixture_paths(args)
+    for path in paths:
+        with open(path, "rb") as f:
+            payload = f.read()
+
+        configure()
+        api = Api()
+        parsers = {
+            "json": lambda: api.parse_state(json.loads(payload)),
+            "stream": lambda: api.parse_stream(iter_chunks(payload)),
+        }
+
+        states = {}
+        for name, parse in parsers.items():
+            parse()
+            states[name], _, _, peak = measure_allocations(parse)
+            elapsed = time_per_run(parse, args.runs)
+            print("{0:>14} {1:>6}: {2:7.1f} KiB, {3:8.3f} ms, {4:8.1f} KiB peak".format(os.path.basename(path), name, len(payload) / 1024, elapsed * 1000, peak / 1024))
+        print("{0:>14} {1:>6}: {2}".format(os.path.basename(path), "same", states["json"] == states["stream"]))
+
+# The previous filter, which re-read the settings and parsed both times with
+# strptime for every departure
+def strptime_include(settings, destination_tiploc, departure):
+    if settings.platforms and departure["location"]["forecast"]["plat"]["plat"] not in settings.platforms:
+        return False
+    if settings.tocs and departure["toc"] not in settings.tocs:
+        return False
+    if "departed" in departure["location"]["forecast"] and departure["location"]["forecast"]["departed"]:
+        return False
+    if settings.destination and not any(stop["tpl"] == destination_tiploc for stop in departure["calling"] or ()):
+        return False
+
+    origin_ts = datetime.strptime(departure["ssd"] + " " + departure["origin"]["timetable"]["time"], "%Y-%m-%d %H:%M:%S")
+    depart_ts = datetime.strptime(departure["ssd"] + " " + departure["location"]["displaytime"], "%Y-%m-%d %H:%M:%S")
+    if origin_ts > depart_ts:
+        depart_ts += timedelta(days=1)
+    return depart_ts < datetime.now() + timedelta(hours=settings.cutoff)
+
+# Cost per departure of filtering with more and more settings, compared with
+# the previous filter, including services that run past midnight
+def benchmark_filters(args):
+    from trains.filters import DepartureFilter
+    from trains.lookup import Lookup
+
+    data = load_fixture(args)
+    for i, departure in enumerate(data["departures"]):
+        if i % 4 == 0:
+            # Started yesterday evening, with us after midnight
+            departs = datetime.strptime(departure["ssd"], "%Y-%m-%d") - timedelta(days=1)
+            departure["ssd"] = departs.strftime("%Y-%m-%d")
+            departure["origin"]["timetable"]["time"] = "23:{0:02d}:00".format(i % 60)
+        if i % 3 == 0 and departure["calling"] and all(stop["tpl"] != "RDNGSTN" for stop in departure["calling"]):
+            # Calling at Reading, for the destination filter to find
+            departure["calling"].insert(0, {"tpl": "RDNGSTN", "time": departure["calling"][0]["time"]})
+    lookup = Lookup(data)
+
+    configs = {
+        "none": {},
+        "cutoff": {"cutoff": 1},
+        "platforms": {"cutoff": 1, "platforms": "1,2,3,4,5,6,7,8,9,10"},
+        "tocs": {"cutoff": 1, "platforms": "1,2,3,4,5,6,7,8,9,10", "tocs": "GW,XR"},
+        "destination": {"cutoff": 1, "tocs": "GW,XR", "destination": "RDG"},
+    }
+    departures = data["departures"]
+    for name, settings in configs.items():
+        configure(**settings)
+        settings = Config.snapshot().settings
+        destination_tiploc = lookup.crs_to_tiploc(settings.destination) if settings.destination else None
+
+        filters = {
+            "strptime": lambda: [strptime_include(settings, destination_tiploc, departure) for departure in departures],
+        }
+        def compiled():
+            departure_filter = DepartureFilter(settings)
+            departure_filter.set_lookup(lookup)
+            return [departure_filter(departure) for departure in departures]
+        filters["compiled"] = compiled
+
+        results = {}
+        for method, fn in filters.items():
+            results[method] = fn()
+            elapsed = time_per_run(fn, args.runs)
+            print("{0:>11} {1:>8}: {2:6.2f} us per departure, {3:4d} shown".format(name, method, elapsed * 1000000 / len(departures), sum(results[method])))
+        # Agreeing on showing nothing doesn't tell us much
+        same = results["strptime"] == results["compiled"]
+        if not any(results["strptime"]):
+            same = "nothing shown to compare"
+        print("{0:>11} {1:>8}: {2}".format(name, "same", same))
+
+# Rows redrawn, and time taken, when one train's status changes, when a field
+# the rows don't show changes, and when the services change
+def benchmark_update(args):
+    import trains.elements as elements
+
+    board = create_board()
+    board.update_data(datetime.now() + timedelta(seconds=10), 0)
+    state = sample_state()
+
+    def with_status(departure, actual):
+        values = dict(departure)
+        values.update(actual=actual, status=None)
+        return type(departure)(**values)
+
+    departures = list(state["departures"])
+    delayed = list(departures)
+    delayed[2] = with_status(delayed[2], "23:59")
+    # A change to a field that the rows don't show
+    reason = list(departures)
+    reason[2] = type(reason[2])(**dict(reason[2], late_reason="a late running freight train"))
+    scenarios = {
+        "status": (departures, delayed),
+        "reason": (departures, reason),
+        "services": (departures, departures[1:]),
+    }
+
+    rendered = [0]
+    render_departure = elements.render_departure
+    def counting_render(*args, **kwargs):
+        rendered[0] += 1
+        return render_departure(*args, **kwargs)
+
+    elements.render_departure = counting_render
+    try:
+        for name, boards in scenarios.items():
+            states = [type(state)(**dict(state, departures=tuple(board_departures))) for board_departures in boards]
+            rendered[0] = 0
+            start = time.perf_counter()
+            for i in range(args.runs):
+                board.departureboard.update_state(states[i % 2])
+            elapsed = (time.perf_counter() - start) / args.runs
+            print("{0:>9}: {1:5.2f} rows drawn, {2:7.1f} us per update".format(name, rendered[0] / args.runs, elapsed * 1000000))
+    finally:
+        elements.render_departure = render_departure
+
+# A serial interface that takes as long as a real SPI bus to send the data
+class DelaySerial:
+    def __init__(self, bus_speed=2000000):
+        self.bus_speed = bus_speed
+
+    def command(self, *cmd):
+        time.sleep(len(cmd) * 8 / self.bus_speed)
+
+    def data(self, data):
+        time.sleep(len(data) * 8 / self.bus_speed)
+
+    def cleanup(self):
+        return
+
+# Frames drawn by several panels rendering one after another in one thread,
+# compared with a thread per panel, and the requests made upstream when two
+# of the panels show the same station
+def benchmark_panels(args):
+    from trains.panels import Panels
+
+    server = serve_fixture(load_fixture(args))
+    config = copy.deepcopy(CONFIG)
+    config["debug"].update({"url": fixture_url(server), "frequency": 5})
+    config["panels"] = [
+        {"settings": {"departure": "PAD", "platforms": ["1", "2"]}},
+        {"settings": {"departure": "PAD", "platforms": ["3", "4"]}},
+        {"settings": {"departure": "RDG"}},
+    ]
+    Config.load(config)
+
+    for mode in ("sequential", "threaded"):
+        server.requests = 0
+        panels = Panels(Config.snapshot(), serials=[DelaySerial() for _ in config["panels"]])
+        for station in panels.stations:
+            station.start()
+
+        end = time.monotonic() + args.seconds
+        if mode == "threaded":
+            for panel in panels.panels:
+                panel.start()
+            time.sleep(args.seconds)
+        else:
+            frames = 0
+            while time.monotonic() < end:
+                timestamp = datetime.now()
+                for panel in panels.panels:
+                    panel.board.update_data(timestamp, frames)
+                    if panel.board.render(timestamp, frames):
+                        panel.frames += 1
+                frames += 1
+                deadline = min((panel.board.get_deadline() or end for panel in panels.panels), default=end)
+                time.sleep(max(min(deadline, end) - time.monotonic(), 0))
+        panels.stop(timeout=2)
+
+        frames = [panel.frames for panel in panels.panels]
+        fonts = len(set(id(panel.board.fonts) for panel in panels.panels))
+        print("{0:>10}: {1:6.1f} frames/s per panel, {2:d} stations, {3:3d} requests, {4:d} font sets".format(
+            mode, sum(frames) / len(frames) / args.seconds, len(panels.stations), server.requests, fonts))
+    server.shutdown()
+
+# Requests reaching the board API when many boards fetch from it directly,
+# compared with fetching through the proxy, and whether they see the same
+def benchmark_proxy(args):
+    from concurrent.futures import ThreadPoolExecutor
+    from trains.api import Api
+    from trains.config import compile_config
+    from trains.proxy import ProxyServer
+
+    upstream = serve_fixture(load_fixture(args), delay=0.05, compress=True, etag=True)
+    base = Config.snapshot()
+    proxy = ProxyServer(compile_config({"debug": {"url": fixture_url(upstream)}, "proxy": {"host": "127.0.0.1", "port": 0, "ttl": 1}}, base=base))
+    threading.Thread(target=proxy.serve_forever, daemon=True).start()
+    proxy_url = "http://127.0.0.1:{0}".format(proxy.server_address[1])
+
+    # Twenty boards at two stations, with different platforms
+    boards = []
+    for i in range(20):
+        settings = {"departure": ("PAD", "RDG")[i % 2], "platforms": [] if i % 3 == 0 else [str(i % 12 + 1)]}
+        boards.append(compile_config({"settings": settings}, base=base))
+
+    def direct(config):
+        return compile_config({"debug": {"url": fixture_url(upstream)}}, base=config)
+
+    def proxied(config):
+        return compile_config({"debug": {"proxy": proxy_url}}, base=config)
+
+    states = {}
+    for name, configure_board in (("direct", direct), ("proxy", proxied)):
+        upstream.requests = 0
+        apis = [Api(configure_board(config)) for config in boards]
+        latencies = []
+
+        def poll(api):
+            end = time.monotonic() + args.seconds
+            results = []
+            while time.monotonic() < end:
+                start = time.perf_counter()
+                results.append(api.get_state())
+                latencies.append(time.perf_counter() - start)
+                time.sleep(0.2)
+            return results[-1]
+
+        # Every board asks at once, as after a power cut
+        with ThreadPoolExecutor(len(apis)) as executor:
+            states[name] = list(executor.map(poll, apis))
+
+        downloaded = sum(api.downloaded for api in apis)
+        for api in apis:
+            api.close()
+        print("{0:>7}: {1:5d} board requests, {2:4d} upstream requests, {3:8.0f} bytes per request, {4:6.2f} ms average".format(
+            name, len(latencies), upstream.requests, downloaded / len(latencies), sum(latencies) / len(latencies) * 1000))
+
+    print("   same: {0}".format(states["direct"] == states["proxy"]))
+    proxy.shutdown()
+    proxy.server_close()
+    upstream.shutdown()
+
+# Message text from BeautifulSoup compared with the tag stripper, parsing a
+# board's messages with and without the cache, and what importing bs4 costs
+def benchmark_messages(args):
+    import sys
+    from bs4 import BeautifulSoup
+    from trains.api import Api
+    from trains.lookup import Lookup
+    from trains.markup import strip_tags
+
+    data = load_fixture(args) if args.fixture else json.load(open(os.path.join(FIXTURES, "messages.json")))
+    markups = [message["message"] for message in data.get("messages") or ()]
+
+    expected = [BeautifulSoup(markup, features="html.parser").get_text() for markup in markups]
+    print("     same: {0} of {1} messages".format(sum(strip_tags(markup) == text for markup, text in zip(markups, expected)), len(markups)))
+
+    def soup():
+        for markup in markups:
+            BeautifulSoup(markup, features="html.parser").get_text()
+
+    def stripped():
+        for markup in markups:
+            strip_tags(markup)
+
+    api = Api()
+    location = Lookup(data).location(data["station"][0])
+    for name, fn in (("bs4", soup), ("stripped", stripped), ("cached", lambda: api.parse_messages(location, data))):
+        elapsed = time_per_run(fn, args.runs)
+        print("{0:>9}: {1:8.1f} us per board".format(name, elapsed * 1000000))
+    print("{0:>9}: {1:d} parses over {2:d} boards".format("cache", api.message_parses, args.runs))
+
+    code = "import time; start = time.perf_counter(); import bs4; print(time.perf_counter() - start)"
+    elapsed = float(subprocess.check_output([sys.executable, "-c", code]))
+    print("{0:>9}: {1:8.1f} ms to import bs4".format("import", elapsed * 1000))
+
+# Drawing takes this many times longer on a Raspberry Pi than here
+SLOWDOWN = 10
+
+def slow_down(fn):
+    def slowed(*args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        end = start + (time.perf_counter() - start) * SLOWDOWN
+        while time.perf_counter() < end:
+            pass
+        return result
+    return slowed
+
+# How long the render loop is held up by each frame, and how late and how
+# unevenly frames reach the display, when each frame is drawn and sent in
+# turn compared with sending from another thread. Drawing and packing pixels
+# for the bus are slowed down to take as long as they would on a Pi.
+def benchmark_pipeline(args):
+    for pipeline in (False, True):
+        config = copy.deepcopy(CONFIG)
+        config["debug"]["pipeline"] = pipeline
+        Config.load(config)
+
+        board = create_board(DelaySerial(16000000))
+        board.update_data(datetime.now() + timedelta(seconds=10), 0)
+        for hotspot, xy in board.viewport._hotspots:
+            hotspot.paste_into = slow_down(hotspot.paste_into)
+        board.device.pack = slow_down(board.device.pack)
+        board.viewport.frames.reset()
+
+        frames = 0
+        blocked = 0.0
+        end = time.monotonic() + args.seconds
+        while time.monotonic() < end:
+            timestamp = datetime.now() + timedelta(seconds=10)
+            board.update_data(timestamp, frames)
+            start = time.perf_counter()
+            if board.render(timestamp, frames):
+                frames += 1
+                blocked += time.perf_counter() - start
+            board.scheduler.wait_until(min(board.get_deadline() or end, end))
+
+        sender = board.viewport.sender
+        if sender:
+            sender.flush()
+            sender.stop()
+        times = board.viewport.frames
+        print("{0:>10}: {1:5.1f} frames/s, {2:3d} dropped, {3:6.2f} ms blocked per frame, {4:6.2f} ms late (p50), {5:6.2f} ms (p95), {6:6.2f} ms jitter".format(
+            "pipelined" if pipeline else "serial", frames / args.seconds, sender.dropped if sender else 0, blocked * 1000 / max(frames, 1),
+            times.percentile(0.5) * 1000, times.percentile(0.95) * 1000, times.jitter() * 1000))
+
+# Time to turn a frame into GDDRAM bytes with luma's per-pixel packing, the
+# lookup table, and the lookup table with NumPy, and frames not sent at all
+# because the display already had them
+def benchmark_packing(args):
+    import numpy
+    from trains.display import PartialSSD1322, RecordingSerial, NumpyFramePacker
+
+    board = create_board()
+    board.update_data(datetime.now() + timedelta(seconds=10), 0)
+    board.viewport.refresh(force=True)
+    image = board.device.image
+
+    device = PartialSSD1322(RecordingSerial(), mode="1")
+    device.numpy = None
+    packer = device.get_packer()
+    numpy_packer = NumpyFramePacker(numpy, packer.lut, device.width, device.height)
+    region = (0, 0, device.width, device.height)
+
+    def luma():
+        buf = bytearray(device.width * device.height >> 1)
+        device._render_mono(buf, image.getdata())
+        return bytes(buf)
+
+    def lookup():
+        packer.pack(image)
+        return packer.region(region)
+
+    def vectorised():
+        numpy_packer.pack(image)
+        return numpy_packer.region(region)
+
+    expected = luma()
+    for name, fn in (("luma", luma), ("lookup", lookup), ("numpy", vectorised)):
+        elapsed = time_per_run(fn, args.runs)
+        print("{0:>7}: {1:8.1f} us per frame, same: {2}".format(name, elapsed * 1000000, fn() == expected))
+
+    # A board left running, with every frame sent in full
+    serial = RecordingSerial()
+    board = create_board(serial)
+    board.viewport.partial = False
+    frames = 0
+    end = time.monotonic() + args.seconds
+    while time.monotonic() < end:
+        timestamp = datetime.now() + timedelta(seconds=10)
+        board.update_data(timestamp, frames)
+        if board.render(timestamp, frames):
+            frames += 1
+        board.scheduler.wait_until(min(board.get_deadline() or end, end))
+    print("{0:>7}: {1:d} of {2:d} full frames not sent".format("skipped", board.device.skipped, frames))
+
+# Requests made overnight and how old the board is when the display comes
+# back on, then CPU used and bytes sent to the display while in powersaving,
+# with the display dimmed compared with it turned off
+def benchmark_sleep(args):
+    import random
+    from trains.display import RecordingSerial
+    from trains.polling import PollingPolicy
+
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    night = (1 * 3600, 6 * 3600)
+    for brightness in (1, 0):
+        config = copy.deepcopy(CONFIG)
+        config["settings"]["powersaving"] = {"start": "01:00", "end": "06:00", "brightness": brightness}
+        Config.load(config)
+        policy = PollingPolicy(Config.snapshot(), random.Random(1))
+
+        requests = 0
+        fetched = None
+        seconds = 37
+        while seconds < night[1]:
+            if seconds >= night[0]:
+                requests += 1
+            fetched = seconds
+            policy.record(simulated_board(int(seconds // 60)))
+            seconds += policy.interval(day + timedelta(seconds=seconds))
+
+        print("{0:>7}: {1:4d} requests overnight, board {2:5.1f} minutes old on waking".format(
+            "dimmed" if brightness else "off", requests, (night[1] - fetched) / 60))
+
+    for brightness in (1, 0):
+        now = datetime.now()
+        config = copy.deepcopy(CONFIG)
+        config["settings"]["powersaving"] = {
+            "start": (now - timedelta(hours=1)).strftime("%H:%M"),
+            "end": (now + timedelta(hours=1)).strftime("%H:%M"),
+            "brightness": brightness,
+        }
+        Config.load(config)
+
+        serial = RecordingSerial()
+        board = create_board(serial)
+        board.bus_rate()
+
+        frames = 0
+        end = time.monotonic() + args.seconds
+        cpu = time.process_time()
+        while time.monotonic() < end:
+            timestamp = datetime.now() + timedelta(seconds=10)
+            board.update_data(timestamp, frames)
+            if board.render(timestamp, frames):
+                frames += 1
+            board.scheduler.wait_until(min(board.get_deadline() or end, end))
+        cpu = time.process_time() - cpu
+
+        print("{0:>7}: {1:6d} frames, {2:7.2f} CPU seconds per hour, {3:8.0f} bytes/s to the display".format(
+            "dimmed" if brightness else "off", frames, cpu * 3600 / args.seconds, board.bus_rate()))
+
+# Time from starting until departures are on the display, first waiting for
+# a fetch from a slow server, then restarting with the board that run saved
+def benchmark_restart(args):
+    import tempfile
+    from trains.api import Api
+    from trains.board import Board
+    from trains.fetcher import Fetcher
+    from trains.saved import SavedState
+
+    server = serve_fixture(load_fixture(args), delay=1)
+    config = copy.deepcopy(CONFIG)
+    config["debug"]["url"] = fixture_url(server)
+    Config.load(config)
+    os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp()
+
+    fonts = Board.load_fonts()
+    for name in ("cold", "warm"):
+        start = time.perf_counter()
+        board = Board(fonts=fonts)
+        saved = SavedState(Config.snapshot())
+        restored = saved.load()
+        if restored:
+            board.restore(*restored)
+        board.departure_board()
+
+        def updated(state):
+            board.update_state(state)
+            saved.save(state)
+
+        fetcher = Fetcher(Api(), 60, updated)
+        fetcher.start()
+
+        shown = None
+        while not fetcher.stats.fetches or board.restored is not None or not board.departureboard.next_service.added:
+            timestamp = datetime.now()
+            board.update_data(timestamp, 0)
+            board.render(timestamp, 0)
+            if shown is None and board.departureboard.next_service.added:
+                shown = time.perf_counter() - start
+            board.scheduler.wait_until(min(board.get_deadline() or time.monotonic() + 0.1, time.monotonic() + 0.1))
+        fetcher.stop(timeout=2)
+
+        # Until the live board is drawn
+        board.update_data(datetime.now(), 0)
+        board.render(datetime.now(), 0)
+        live = time.perf_counter() - start
+        print("{0:>5}: departures shown after {1:7.1f} ms, live board after {2:7.1f} ms".format(name, shown * 1000, live * 1000))
+
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        state, _ = saved.load()
+    elapsed = (time.perf_counter() - start) / args.runs
+    print("saved board: {0} bytes, {1:.2f} ms to load, {2}".format(
+        os.path.getsize(saved.path), elapsed * 1000, "matches" if state == fetcher.api.get_state() else "differs"))
+    server.shutdown()
+
+# The clock as it was, laid out and drawn in full ten times a second
+class PolledClock(snapshot):
+    def __init__(self, fonts):
+        super(PolledClock, self).__init__(256, 14, None, 0.1)
+        self.fonts = fonts
+
+    def draw(self, image, now):
+        hour, minute, seconds = str(now).split('.')[0].split(':')
+        hourmin = "{0}:{1}".format(hour, minute)
+        seconds = ":{0}".format(seconds)
+
+        w1 = self.fonts["boldlarge"].getlength(hourmin)
+        w2 = self.fonts["boldtall"].getlength(":00")
+
+        margin = (self.width - w1 - w2) / 2
+
+        self.fonts["boldlarge"].draw(image, (margin, 0), hourmin)
+        self.fonts["boldtall"].draw(image, (margin + w1, 5), seconds)
+
+    def paste_into(self, image, xy):
+        im = Image.new(image.mode, self.size)
+        self.draw(im, datetime.now().time())
+        image.paste(im, xy)
+        self.last_updated = time.monotonic()
+
+# Redraws, CPU and bytes sent to the display for the clock on its own, drawn
+# in full every 0.1 s, then from sprites once a second, and whether the two
+# draw the same for every second of the day
+def benchmark_clock(args):
+    from trains.board import Board
+    from trains.display import CountingSerial, DirtyViewport, PartialSSD1322, RecordingSerial
+    from trains.elements import Clock, get_deadline
+
+    fonts = Board.load_fonts()
+
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    polled = PolledClock(fonts)
+    clock = Clock(256, 14, fonts)
+    different = 0
+    for second in range(24 * 60 * 60):
+        now = day + timedelta(seconds=second)
+        expected = Image.new("1", polled.size)
+        polled.draw(expected, now.time())
+        clock.draw(now)
+        if clock.buffer.tobytes() != expected.tobytes():
+            different += 1
+    print("{0:d} seconds of the day drawn differently".format(different))
+
+    for name, hotspot in (("polled", PolledClock(fonts)), ("sprites", Clock(256, 14, fonts))):
+        serial = CountingSerial(RecordingSerial())
+        device = PartialSSD1322(serial, mode="1")
+        viewport = DirtyViewport(device, width=device.width, height=device.height)
+        viewport.add_hotspot(hotspot, (0, 50))
+        viewport.refresh()
+        sent = serial.bytes
+
+        redraws = 0
+        end = time.monotonic() + args.seconds
+        cpu = time.process_time()
+        while time.monotonic() < end:
+            if hotspot.should_redraw():
+                redraws += 1
+            viewport.refresh()
+            time.sleep(max(min(get_deadline(hotspot), end) - time.monotonic(), 0))
+        cpu = time.process_time() - cpu
+
+        print("{0:>8}: {1:6.1f} redraws/s, {2:6.2f} CPU seconds per hour, {3:6.0f} bytes/s to the display".format(
+            name, redraws / args.seconds, cpu * 3600 / args.seconds, (serial.bytes - sent) / args.seconds))
+
+BENCHMARKS = {
+    "scheduler": benchmark_scheduler,
+    "parse": benchmark_parse,
+    "memory": benchmark_memory,
+    "config": benchmark_config,
+    "spi": benchmark_spi,
+    "text": benchmark_text,
+    "wrap": benchmark_wrap,
+    "scroll": benchmark_scroll,
+    "fetch": benchmark_fetch,
+    "conditional": benchmark_conditional,
+    "stream": benchmark_stream,
+    "filters": benchmark_filters,
+    "update": benchmark_update,
+    "polling": benchmark_polling,
+    "panels": benchmark_panels,
+    "proxy": benchmark_proxy,
+    "messages": benchmark_messages,
+    "pipeline": benchmark_pipeline,
+    "packing": benchmark_packing,
+    "sleep": benchmark_sleep,
+    "restart": benchmark_restart,
+    "clock": benchmark_clock,
+    "suite": benchmark_suite,
+    "generate": benchmark_generate,
+    "record": benchmark_record,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline departure board benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS.keys()))
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--fixture", help="A recorded board response, or the name of one in fixtures/, to use instead of a generated one")
+    parser.add_argument("--json", help="Write the suite results to this file")
+    parser.add_argument("--compare", help="Compare the suite results with a previous --json file")
+    args = parser.parse_args()
+
+    if args.benchmark != "record":
+        Config.load(CONFIG)
+    BENCHMARKS[args.benchmark](args)
@@ -1,70 +1,126 @@
-import sys
-from datetime import datetime
-import threading
-import time
-from pprint import pprint
-
-from luma.core.sprite_system import framerate_regulator
-
-from trains.api import Api
-from trains.board import Board
-from trains.config import Config
-
-from time import sleep
-import sentry_sdk
-
-sentry_sdk.init("https://7edfb7e655ea43d7b9cc79b5e75030b9@o406991.ingest.sentry.io/5275445")
-
-
-board = Board()
-board.departure_board()
-
-api = Api()
-debug = Config.get("debug.stats", False)
-
-frequency = Config.get("debug.frequency", 60)
-framerate = Config.get("debug.framerate", 0)
-regulator = framerate_regulator(fps=framerate)
-timer = None
-
-def minute_timer():
-    if not frequency:
-        return
-    timestamp = datetime.now()
-    board.update_powersaving(timestamp)
-    try:
-        state = api.get_cached_state(timestamp, frequency, as_dict=True)
-        board.update_state(state)
-    except Exception as ex:
-        sentry_sdk.capture_exception(ex)
-        pass
-
-    global timer
-    timer = threading.Timer(frequency + 1, minute_timer)
-    timer.start()
-
-minute_timer()
-
-sleep(2)
-
-try:
-    while True:
-        with regulator:
-            timestamp = datetime.now()
-
-            board.update_data(timestamp, regulator.called)
-
-            # Render our board
-            board.render(timestamp, regulator.called)
-
-            # Render Stats
-            if debug and regulator.called > 0 and regulator.called % 31 == 0:
-                avg_fps = regulator.effective_FPS()
-                avg_transit_time = regulator.average_transit_time()
-            
-                sys.stdout.write("#### iter = {0:6d}: render time = {1:.2f} ms, frame rate = {2:.2f} FPS\r".format(regulator.called, avg_transit_time, avg_fps))
-                sys.stdout.flush()
-except KeyboardInterrupt:
-    if timer:
-        timer.cancel()
-    pass
+import sys
+
+from trains.startup import StartupProfile
+
+# Run until the first departures are shown and print how long each part took
+profile = StartupProfile("--profile-startup" in sys.argv)
+
+from datetime import datetime
+import time
+from pprint import pprint
+
+from luma.core.sprite_system import framerate_regulator
+
+from trains.board import Board
+from trains.config import Config
+from trains.saved import SavedState
+import trains.reporting as reporting
+
+from time import sleep
+
+profile.phase("imports")
+
+config = Config.snapshot()
+profile.phase("config")
+
+if config.panels:
+    from trains.panels import Panels
+
+    # Several displays, each rendering in its own thread
+    panels = Panels(config, on_error=reporting.capture_exception)
+    profile.phase("initialising")
+    reporting.start()
+
+    Config.subscribe(panels.apply_config)
+    Config.start_refresh(config.debug.config_frequency)
+    panels.start()
+
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        panels.stop(timeout=2)
+        Config.instance.stop()
+    sys.exit(0)
+
+fonts = Board.load_fonts()
+profile.phase("fonts")
+
+board = Board(config, fonts=fonts)
+profile.phase("display")
+
+# Show the board from before we restarted while we fetch a new one
+saved = SavedState(config)
+restored = saved.load()
+if restored:
+    board.restore(*restored)
+
+board.departure_board()
+profile.phase("initialising")
+
+# Everything else can wait until there's something on the screen
+reporting.start()
+
+from trains.api import Api
+from trains.fetcher import Fetcher
+from trains.polling import PollingPolicy
+profile.phase("network")
+
+api = Api(config)
+debug = config.debug.stats
+
+frequency = config.debug.frequency
+framerate = config.debug.framerate
+regulator = framerate_regulator(fps=framerate)
+
+def state_updated(state):
+    profile.phase("first fetch")
+    board.update_state(state)
+    saved.save(state)
+
+def fetch_failed(ex):
+    reporting.capture_exception(ex)
+
+policy = PollingPolicy(config)
+fetcher = Fetcher(api, frequency, state_updated, fetch_failed, policy, saved.apply_config)
+
+def config_updated(config, changed):
+    # Both are applied on their own threads
+    board.apply_config(config, changed)
+    fetcher.apply_config(config, changed)
+
+Config.subscribe(config_updated)
+Config.start_refresh(config.debug.config_frequency)
+
+fetcher.start()
+
+try:
+    while True:
+        with regulator:
+            timestamp = datetime.now()
+
+            board.update_data(timestamp, regulator.called)
+
+            # Render our board
+            rendered = board.render(timestamp, regulator.called)
+
+            if profile.enabled and rendered and not board.finish_init:
+                profile.phase("departures")
+                profile.report()
+                break
+
+            # Render Stats
+            if debug and regulator.called > 0 and regulator.called % 31 == 0:
+                avg_fps = regulator.effective_FPS()
+                avg_transit_time = regulator.average_transit_time()
+            
+                sys.stdout.write("#### iter = {0:6d}: render time = {1:.2f} ms, frame rate = {2:.2f} FPS, slept = {3:.1f}s, bus = {4:.0f} B/s, fetch = {5:.0f} ms ({6} errors, {7} KiB, {8} parses, {9} avoided), jitter = {10:.1f} ms\r".format(regulator.called, avg_transit_time, avg_fps, board.scheduler.slept, board.bus_rate(), fetcher.stats.average() * 1000, fetcher.stats.errors, api.downloaded // 1024, api.parses, api.parses_avoided, board.frame_jitter() * 1000))
+                sys.stdout.flush()
+
+        # Sleep until a hotspot is due to be redrawn or new data arrives
+        board.wait()
+except KeyboardInterrupt:
+    pass
+
+fetcher.stop(timeout=2)
+Config.instance.stop()
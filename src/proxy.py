@@ -0,0 +1,24 @@
+import sys
+
+from trains.config import Config
+from trains.proxy import ProxyServer
+
+import sentry_sdk
+
+sentry_sdk.init("https://7edfb7e655ea43d7b9cc79b5e75030b9@o406991.ingest.sentry.io/5275445")
+
+config = Config.snapshot()
+
+server = ProxyServer(config)
+Config.subscribe(server.apply_config)
+Config.start_refresh(config.debug.config_frequency)
+
+print("Serving boards on {0}:{1}".format(config.proxy.host, config.proxy.port))
+sys.stdout.flush()
+
+try:
+    server.serve_forever()
+except KeyboardInterrupt:
+    server.server_close()
+    Config.instance.stop()
+    pass
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+from trains.config import compile_config
+from trains.filters import DAY, DepartureFilter, departure_offset
+from trains.lookup import Lookup
+
+TIPLOCS = {
+    "PADTON": {"locname": "London Paddington", "crs": "PAD"},
+    "RDNGSTN": {"locname": "Reading", "crs": "RDG"},
+    "SWINDON": {"locname": "Swindon", "crs": "SWI"},
+    "OXFD": {"locname": "Oxford", "crs": "OXF"},
+}
+
+
+def settings(**values):
+    return compile_config({"settings": values}).settings
+
+def departure(ssd, origin, departs, platform="1", toc="GW", calling=("RDNGSTN",), departed=False):
+    return {
+        "ssd": ssd,
+        "toc": toc,
+        "origin": {"tiploc": "PADTON", "timetable": {"time": origin}},
+        "location": {
+            "displaytime": departs,
+            "forecast": {"plat": {"plat": platform}, "departed": departed},
+        },
+        "calling": [{"tpl": tiploc} for tiploc in calling],
+    }
+
+def create_filter(now, **values):
+    departure_filter = DepartureFilter(settings(**values), now=now)
+    departure_filter.set_lookup(Lookup({"tiploc": TIPLOCS}))
+    return departure_filter
+
+
+def test_offset_same_day():
+    assert departure_offset("08:00:00", "09:15:30") == 9 * 3600 + 15 * 60 + 30
+
+def test_offset_rolls_over_midnight():
+    assert departure_offset("23:30:00", "00:15:00") == DAY + 15 * 60
+
+def test_before_midnight_viewed_after_midnight():
+    departure_filter = create_filter(datetime(2024, 3, 2, 0, 10), cutoff=1)
+
+    # Started yesterday evening, and departs us after midnight
+    assert departure_filter(departure("2024-03-01", "23:30:00", "00:20:00"))
+    assert departure_filter(departure("2024-03-01", "23:30:00", "01:05:00"))
+    assert not departure_filter(departure("2024-03-01", "23:30:00", "01:15:00"))
+
+    # Departing yesterday, before now, is still before the cutoff
+    assert departure_filter(departure("2024-03-01", "23:00:00", "23:50:00"))
+
+def test_after_midnight_viewed_before_midnight():
+    departure_filter = create_filter(datetime(2024, 3, 1, 23, 40), cutoff=1)
+
+    # Starting tomorrow
+    assert departure_filter(departure("2024-03-02", "00:10:00", "00:30:00"))
+    assert not departure_filter(departure("2024-03-02", "00:10:00", "00:50:00"))
+
+    # Starting today, and departing us after midnight
+    assert departure_filter(departure("2024-03-01", "23:00:00", "00:30:00"))
+    assert not departure_filter(departure("2024-03-01", "23:00:00", "00:45:00"))
+
+def test_cutoff_across_midnight():
+    departure_filter = create_filter(datetime(2024, 3, 1, 23, 30), cutoff=2)
+
+    assert departure_filter(departure("2024-03-01", "22:00:00", "23:45:00"))
+    assert departure_filter(departure("2024-03-02", "00:05:00", "01:29:00"))
+    assert not departure_filter(departure("2024-03-02", "00:05:00", "01:31:00"))
+    # A day later is well past the cutoff
+    assert not departure_filter(departure("2024-03-03", "00:05:00", "00:10:00"))
+
+def test_limit_cached_per_ssd():
+    departure_filter = create_filter(datetime(2024, 3, 1, 23, 40), cutoff=1)
+
+    departures = [
+        departure("2024-03-01", "23:00:00", "23:55:00"),
+        departure("2024-03-02", "00:10:00", "00:30:00"),
+        departure("2024-03-01", "23:50:00", "00:35:00"),
+        departure("2024-03-02", "00:20:00", "00:41:00"),
+    ]
+    assert [departure_filter(d) for d in departures] == [True, True, True, False]
+
+    # One limit for each service start date, a day apart
+    assert set(departure_filter.limits) == {"2024-03-01", "2024-03-02"}
+    assert departure_filter.limits["2024-03-01"] == 24 * 3600 + 40 * 60
+    assert departure_filter.limits["2024-03-01"] - departure_filter.limits["2024-03-02"] == DAY
+
+    # Asking again gives the same answers from the cached limits
+    assert [departure_filter(d) for d in departures] == [True, True, True, False]
+
+def test_destination_matches_calling_points():
+    departure_filter = create_filter(datetime(2024, 3, 1, 12, 0), destination="SWI")
+
+    assert departure_filter(departure("2024-03-01", "11:50:00", "12:05:00", calling=("RDNGSTN", "SWINDON")))
+    assert not departure_filter(departure("2024-03-01", "11:50:00", "12:10:00", calling=("RDNGSTN", "OXFD")))
+    assert not departure_filter(departure("2024-03-01", "11:50:00", "12:15:00", calling=()))
+
+def test_destination_not_in_lookup():
+    departure_filter = create_filter(datetime(2024, 3, 1, 12, 0), destination="XYZ")
+
+    assert not departure_filter(departure("2024-03-01", "11:50:00", "12:05:00", calling=("RDNGSTN", "SWINDON")))
+
+def test_platforms_tocs_and_departed():
+    departure_filter = create_filter(datetime(2024, 3, 1, 12, 0), platforms="1,2", tocs="GW")
+
+    assert departure_filter(departure("2024-03-01", "11:50:00", "12:05:00", platform="2"))
+    assert not departure_filter(departure("2024-03-01", "11:50:00", "12:05:00", platform="3"))
+    assert not departure_filter(departure("2024-03-01", "11:50:00", "12:05:00", toc="XR"))
+    assert not departure_filter(departure("2024-03-01", "11:50:00", "12:05:00", departed=True))
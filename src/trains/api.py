@@ -1,209 +1,298 @@
-import time
-from datetime import datetime, timedelta
-from pprint import pprint
-import json
-
-import requests
-from bs4 import BeautifulSoup
-
-from trains.config import Config
-from trains.data import *
-
-
-class Api:
-    __state = None
-    __dict = None
-    __timestamp = None
-
-    def get_cached_state(self, timestamp, frequency, as_dict=False):
-        if not self.__state or timestamp >= self.__timestamp:
-            self.__state = self.get_state()
-            self.__dict = json.loads(json.dumps(self.__state, default=lambda o: o.__dict__))
-            self.__timestamp = timestamp + timedelta(seconds=frequency)
-        
-        if as_dict:
-            return self.__dict
-        else:
-            return self.__state
-
-    def get_state(self, as_dict=False):
-        departure = Config.get("settings.departure")
-        if Config.get("debug.url"):
-            url = Config.get("debug.url")
-        else:
-            url = "https://ldb.prod.a51.li/boards/{0}?term=false&t={1}000&limit=0".format(departure, int(time.time()))
-
-        data = self.get_from_nrea(url)
-
-        state = State()
-
-        self.parse_station(state, data)
-        self.parse_messages(state, data)
-        self.parse_departures(state, data)
-        
-        return state
-    
-    def get_from_nrea(self, url):
-        response = requests.get(url)
-        return response.json()
-    
-    def crs_to_tiploc(self, lookup, crs):
-        for station in lookup:
-            if "crs" not in lookup[station]:
-                continue
-
-            if lookup[station]["crs"] == crs:
-                return station
-        return None
-
-    
-    def calls_at(self, lookup_data, departure, destination):
-        destination_tiploc = self.crs_to_tiploc(lookup_data["tiploc"], destination)
-        if not departure["calling"]:
-            return False
-        for station in departure["calling"]:
-            if station["tpl"] == destination_tiploc:
-                return True
-        return False
-    
-    def parse_departures(self, state, data):
-        destination = Config.get("settings.destination")
-        platforms = Config.get("settings.platforms")
-        limit = Config.get("settings.services", 3)
-        tocs = Config.get("settings.tocs")
-        if data["departures"]:
-            departures = sorted(data["departures"], key=lambda departure: departure["location"]["timetable"]["time"])
-        else:
-            departures = []
-        
-        
-        cutoff = datetime.now() + timedelta(hours=Config.get("settings.cutoff", 8))
-
-        state.departures = []
-        for departure in departures:
-            # Hide platforms we don't care about
-            if platforms and departure["location"]["forecast"]["plat"]["plat"] not in platforms:
-                continue
-
-            # Hide specific tocs
-            if tocs and departure["toc"] not in tocs:
-                continue
-
-            # Hide Departed
-            if "departed" in departure["location"]["forecast"] and departure["location"]["forecast"]["departed"]:
-                continue
-
-            # Hide ones that aren't calling at our destination
-            if destination and not self.calls_at(data, departure, destination):
-                continue
-            
-            # Hide any after our cutoff
-            
-            # Calculate a python datetime
-            origin_ts = datetime.strptime(departure["ssd"] + " " + departure["origin"]["timetable"]["time"], "%Y-%m-%d %H:%M:%S")
-            depart_ts = datetime.strptime(departure["ssd"] + " " + departure["location"]["displaytime"], "%Y-%m-%d %H:%M:%S")
-            if origin_ts > depart_ts:
-                # We need to add a day to the datetime
-                depart_ts += timedelta(days=1)
-            if depart_ts >= cutoff:
-                continue
-            
-            state.departures.append(self.create_departure(data, departure))
-
-            if len(state.departures) >= limit:
-                return
-
-    def create_departure(self, lookup_data, data):
-        departure = Departure()
-        
-        departure.rid = data["rid"]
-        departure.headcode = data["trainId"]
-        departure.toc = data["toc"]
-        departure.toc_name = lookup_data["toc"][data["toc"]]["tocname"]
-        if "plat" in data["location"]["forecast"]["plat"]:
-            departure.platform = data["location"]["forecast"]["plat"]["plat"]
-        if "arrived" in data["location"]["forecast"]:
-            departure.arrived = data["location"]["forecast"]["arrived"]
-        if "length" in data["location"]:
-            departure.length = int(data["location"]["length"])
-
-        if departure.platform == "BUS":
-            departure.bus = True
-
-        departure.cancelled = False
-        departure.cancel_reason = None
-        if "cancelled" in data["location"] and data["location"]["cancelled"]:
-            departure.cancelled = True
-            cancel_reason = data["cancelReason"]["reason"]
-            if cancel_reason:
-                departure.cancel_reason = lookup_data["reasons"]["cancelled"][str(cancel_reason)]["reasontext"]
-        
-        departure.late_reason = None
-        late_reason = data["lateReason"]["reason"]
-        if late_reason:
-            lookup_data["reasons"]["late"]
-            departure.late_reason = lookup_data["reasons"]["late"][str(late_reason)]["reasontext"]
-        
-        departure.origin = self.get_location_from_tiploc(lookup_data, data["origin"]["tiploc"])
-        departure.destination = self.get_location_from_tiploc(lookup_data, data["dest"]["tiploc"])
-
-        departure.scheduled = data["location"]["displaytime"][:5]
-        departure.actual = data["location"]["forecast"]["time"][:5]
-        
-        departure.stops = []
-        if data["calling"]:
-            for calling in data["calling"]:
-                stop = Stop()
-                stop.location = self.get_location_from_tiploc(lookup_data, calling["tpl"])
-                stop.time = calling["time"][:5]
-                departure.stops.append(stop)
-        
-        departure.status = departure.get_status_string()
-
-        return departure
-
-    def get_location_from_tiploc(self, lookup, tiploc):
-        data = lookup["tiploc"][tiploc]
-
-        location = Location()
-        location.name = data["locname"]
-        location.crs = data["crs"]
-        location.toc = data["toc"]
-        location.toc_name = lookup["toc"][location.toc]["tocname"]
-        location.abbr_name = location.get_abbr_name()
-
-        return location
-    
-    def parse_station(self, state, data):
-        state.location = self.get_location_from_tiploc(data, data["station"][0])
-        state.name = state.location.name
-    
-    def parse_messages(self, state, data):
-        state.messages = []
-        if "messages" not in data:
-          return
-        if not data["messages"]:
-          return
-        for message in data["messages"]:
-            if not state.location.crs in message["station"]:
-                continue
-
-            if "Area51" in message["message"]:
-                continue
-
-            soup = BeautifulSoup(message["message"], features="html.parser")
-            text = soup.get_text()
-
-            if not text:
-                continue
-
-            state.messages.append(text)
-
-if __name__ == "__main__":
-    state = Api().get_state()
-    print(state.name)
-
-    for departure in state.departures:
-        print("\n{0} to {1} ({2}) [{3}]\n".format(departure.scheduled, departure.destination.name, departure.toc_name, departure.platform))
-        for stop in departure.stops:
-            print("\t[{0}] {1}".format(stop.time, stop.location.name))
+import bisect
+import hashlib
+import json
+import time
+from pprint import pprint
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from trains.config import Config
+from trains.data import *
+from trains.filters import DepartureFilter
+from trains.lookup import Lookup
+from trains.markup import strip_tags
+from trains.stream import StreamDecoder, iter_chunks
+
+
+class Api:
+    # The last response we parsed, to skip parsing it again
+    __digest = None
+    __parsed = None
+    __etag = None
+    __modified = None
+
+    def __init__(self, config=None):
+        self.config = config or Config.snapshot()
+
+        # Keep the connection to the board API alive between fetches
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip"
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self.downloaded = 0
+        self.not_modified = 0
+        self.parses = 0
+        self.parses_avoided = 0
+
+        # The text of each message we've seen, by its markup
+        self.messages = {}
+        self.message_parses = 0
+
+    def close(self):
+        self.session.close()
+
+    def apply_config(self, config, changed):
+        self.config = config
+
+        # Filters and replacements are applied when parsing, so refetch
+        self.reset()
+
+    def reset(self):
+        self.__digest = None
+        self.__parsed = None
+        self.__etag = None
+        self.__modified = None
+
+    def get_url(self):
+        if self.config.debug.url:
+            return self.config.debug.url
+        if self.config.debug.proxy:
+            return "{0}/boards/{1}".format(self.config.debug.proxy.rstrip("/"), self.config.settings.departure)
+        return "https://ldb.prod.a51.li/boards/{0}?term=false&t={1}000&limit=0".format(self.config.settings.departure, int(time.time()))
+
+    def get_state(self):
+        payload = self.download(self.get_url())
+        return self.parse_payload(payload)
+
+    def parse_payload(self, payload):
+        # Not modified since we last parsed it
+        if payload is None:
+            self.parses_avoided += 1
+            return self.__parsed
+
+        digest = hashlib.sha1(payload).digest()
+        if digest == self.__digest and self.__parsed is not None:
+            self.parses_avoided += 1
+            return self.__parsed
+
+        state = self.parse_stream(iter_chunks(payload))
+        self.parses += 1
+
+        self.__digest = digest
+        self.__parsed = state
+        return state
+
+    def parse_state(self, data):
+        lookup = Lookup(data, self.config.replacements)
+        location = self.parse_station(data, lookup)
+
+        return State(
+            name=location.name,
+            location=location,
+            messages=self.parse_messages(location, data),
+            departures=self.parse_departures(data, lookup),
+        )
+    
+    def download(self, url, conditional=None):
+        # Only ask for changes if we still have the last response parsed
+        if conditional is None:
+            conditional = self.__parsed is not None
+
+        headers = {}
+        if conditional:
+            if self.__etag:
+                headers["If-None-Match"] = self.__etag
+            if self.__modified:
+                headers["If-Modified-Since"] = self.__modified
+
+        debug = self.config.debug
+        response = self.session.get(url, headers=headers, timeout=(debug.connect_timeout, debug.read_timeout))
+        if response.status_code == 304:
+            self.not_modified += 1
+            return None
+        response.raise_for_status()
+
+        payload = response.content
+        # The bytes read off the wire, before they were decompressed
+        self.downloaded += response.raw.tell() or len(payload)
+
+        self.__etag = response.headers.get("ETag")
+        self.__modified = response.headers.get("Last-Modified")
+        return payload
+
+    def get_from_nrea(self, url):
+        return json.loads(self.download(url))
+    
+    def departure_time(self, departure):
+        return departure["location"]["timetable"]["time"]
+
+    def parse_departures(self, data, lookup):
+        limit = self.config.settings.services
+        if data["departures"]:
+            departures = sorted(data["departures"], key=self.departure_time)
+        else:
+            departures = []
+
+        departure_filter = DepartureFilter(self.config.settings)
+        departure_filter.set_lookup(lookup)
+
+        results = []
+        for departure in departures:
+            if not departure_filter(departure):
+                continue
+            
+            results.append(self.create_departure(lookup, departure))
+
+            if len(results) >= limit:
+                break
+
+        return tuple(results)
+
+    def parse_stream(self, chunks):
+        # The same as parse_state, but reading the response a value at a
+        # time. Departures are filtered as they arrive and we only keep the
+        # earliest few, rather than decoding and sorting all of them.
+        limit = max(self.config.settings.services, 1)
+        departure_filter = DepartureFilter(self.config.settings)
+
+        tables = {}
+        # Departures waiting for the TIPLOC table to check their destination
+        pending = []
+        # The earliest departures so far, as (time, position, departure)
+        kept = []
+
+        def later(position, departure):
+            # Later than all of the departures we're keeping
+            return len(kept) >= limit and (self.departure_time(departure), position) > kept[-1][:2]
+
+        def keep(position, departure):
+            if later(position, departure):
+                return
+            bisect.insort(kept, (self.departure_time(departure), position, departure))
+            del kept[limit:]
+
+        members = StreamDecoder(chunks).members(arrays=("departures",))
+        for position, (key, value) in enumerate(members):
+            if key != "departures":
+                tables[key] = value
+                if key == "tiploc":
+                    departure_filter.set_lookup(Lookup(tables))
+                    for departure in pending:
+                        if departure_filter.calls_at(departure[1]):
+                            keep(*departure)
+                    pending = None
+                continue
+
+            # Filters only ever remove departures, so there's no need to
+            # check one that wouldn't be shown anyway
+            if not value or later(position, value):
+                continue
+
+            if not departure_filter(value):
+                continue
+
+            # We can't check the destination until we have the TIPLOC table
+            if departure_filter.destination and pending is not None:
+                pending.append((position, value))
+                continue
+
+            keep(position, value)
+
+        # Without a TIPLOC table nothing calls at our destination, so any
+        # departures still pending are dropped
+        lookup = Lookup(tables, self.config.replacements)
+        location = self.parse_station(tables, lookup)
+
+        return State(
+            name=location.name,
+            location=location,
+            messages=self.parse_messages(location, tables),
+            departures=tuple(self.create_departure(lookup, departure) for _, _, departure in kept),
+        )
+
+    def create_departure(self, lookup, data):
+        platform = None
+        if "plat" in data["location"]["forecast"]["plat"]:
+            platform = data["location"]["forecast"]["plat"]["plat"]
+
+        arrived = False
+        if "arrived" in data["location"]["forecast"]:
+            arrived = data["location"]["forecast"]["arrived"]
+
+        length = None
+        if "length" in data["location"]:
+            length = int(data["location"]["length"])
+
+        cancelled = False
+        cancel_reason = None
+        if "cancelled" in data["location"] and data["location"]["cancelled"]:
+            cancelled = True
+            cancel_reason = lookup.reason("cancelled", data["cancelReason"]["reason"])
+        
+        stops = ()
+        if data["calling"]:
+            stops = tuple(Stop(location=lookup.location(calling["tpl"]), time=calling["time"][:5]) for calling in data["calling"])
+
+        return Departure(
+            rid=data["rid"],
+            headcode=data["trainId"],
+            toc=data["toc"],
+            toc_name=lookup.toc_name(data["toc"]),
+            platform=platform,
+            arrived=arrived,
+            length=length,
+            bus=platform == "BUS",
+            cancelled=cancelled,
+            cancel_reason=cancel_reason,
+            late_reason=lookup.reason("late", data["lateReason"]["reason"]),
+            origin=lookup.location(data["origin"]["tiploc"]),
+            destination=lookup.location(data["dest"]["tiploc"]),
+            scheduled=data["location"]["displaytime"][:5],
+            actual=data["location"]["forecast"]["time"][:5],
+            stops=stops,
+        )
+    
+    def parse_station(self, data, lookup):
+        return lookup.location(data["station"][0])
+    
+    def parse_messages(self, location, data):
+        if "messages" not in data:
+          return ()
+        if not data["messages"]:
+          return ()
+
+        messages = []
+        # Only keep the messages still on the board, so this doesn't grow
+        seen = {}
+        for message in data["messages"]:
+            if not location.crs in message["station"]:
+                continue
+
+            if "Area51" in message["message"]:
+                continue
+
+            markup = message["message"]
+            text = self.messages.get(markup)
+            if text is None:
+                text = strip_tags(markup)
+                self.message_parses += 1
+            seen[markup] = text
+
+            if not text:
+                continue
+
+            messages.append(text)
+
+        self.messages = seen
+        return tuple(messages)
+
+if __name__ == "__main__":
+    state = Api().get_state()
+    print(state.name)
+
+    for departure in state.departures:
+        print("\n{0} to {1} ({2}) [{3}]\n".format(departure.scheduled, departure.destination.name, departure.toc_name, departure.platform))
+        for stop in departure.stops:
+            print("\t[{0}] {1}".format(stop.time, stop.location.name))
@@ -1,148 +1,304 @@
-import os
-from PIL import ImageFont
-from datetime import time as dtt, datetime, timedelta
-
-from trains.config import Config
-from trains.elements import *
-from trains.scenes import *
-import trains.utils as utils
-
-from luma.core.interface.serial import spi
-from luma.core.device import dummy
-from luma.core.render import canvas
-from luma.oled.device import ssd1322
-from luma.core.virtual import viewport, snapshot, hotspot
-
-class Board:
-    hotspots = {}
-    elements = {}
-
-    def __init__(self):
-        self.__data = None
-        self.__newdata = None
-
-        self.load_fonts()
-        self.init_display()
-        self.init_powersaving()
-        self.tick_updates = []
-
-    def init_powersaving(self):
-        self.brightness = Config.get("settings.brightness")
-        self.normal_brightness = self.brightness
-
-        self.finish_init = datetime.now() + timedelta(seconds=5)
-
-        start = Config.get("settings.powersaving.start", "01:00")
-        end = Config.get("settings.powersaving.end", "07:00")
-        self.powersaving_brightness = Config.get("settings.powersaving.brightness", 0)
-        
-        self.powersaving_start = dtt(hour=int(start[:2]), minute=int(start[3:5]))
-        self.powersaving_end = dtt(hour=int(end[:2]), minute=int(end[3:5]))
-
-        self.update_powersaving(datetime.now())
-
-    def update_powersaving(self, timestamp):
-        if not self.powersaving_start or not self.powersaving_end:
-            return
-
-        powersaving = False
-        now = timestamp.time()
-        if self.powersaving_start <= self.powersaving_end:
-            # eg: 00:00 - 07:00
-            if self.powersaving_start <= now < self.powersaving_end:
-                powersaving = True
-        elif now >= self.powersaving_start or now < self.powersaving_end:
-            # eg: 22:00 - 06:00
-            powersaving = True
-        
-        if powersaving and self.brightness != self.powersaving_brightness:
-            self.set_brightness(self.powersaving_brightness)
-        elif not powersaving and self.brightness != self.normal_brightness:
-            self.set_brightness(self.normal_brightness)
-
-    
-    def departure_board(self):
-        # Our scenes
-        self.clock = Clock(self)
-        self.initialising = Initialising(self)
-        self.noservices = NoServices(self)
-        self.departureboard = DepartureBoard(self)
-
-        self.tick_updates.append(self.noservices)
-        self.tick_updates.append(self.departureboard)
-
-        self.initialising.show()
-        self.viewport.refresh()
-        self.show_image()
-    
-    def load_fonts(self):
-        self.fonts = {
-            "regular": self.load_font("Dot Matrix Regular.ttf", 10),
-            "bold": self.load_font("Dot Matrix Bold.ttf", 10),
-            "boldtall": self.load_font("Dot Matrix Bold Tall.ttf", 10),
-            "boldlarge": self.load_font("Dot Matrix Bold.ttf", 20)
-        }
-    
-    def load_font(self, font, size):
-        path = os.path.abspath(
-            os.path.join(
-                os.path.dirname(__file__),
-                '../'
-                'fonts',
-                font
-            )
-        )
-        return ImageFont.truetype(path, size)
-    
-    def init_display(self):
-        if Config.get("debug.dummy", False):
-            self.device = dummy(width=256, height=64, rotate=0, mode="1")
-        else:
-            serial = spi(bus_speed_hz=Config.get("debug.bus_speed", 16000000))
-            self.device = ssd1322(serial, mode="1", rotate=0)
-        
-        self.viewport = viewport(self.device, width=self.device.width, height=self.device.height)
-    
-    def update_state(self, state):
-        self.__newdata = state
-    
-    def set_brightness(self, value):
-        self.brightness = value
-        self.device.contrast(value)
-    
-    def update_data(self, timestamp, tick):
-        # Tick Updates
-        for scene in self.tick_updates:
-            scene.update_tick(timestamp, tick)
-
-        if self.finish_init and timestamp < self.finish_init:
-            return
-        
-        # Only care if data has changed
-        if self.__newdata != self.__data:
-            self.__data = self.__newdata
-
-            self.finish_init = None
-            
-            self.initialising.hide()
-            self.clock.show()
-
-            if len(self.__data["departures"]) == 0:
-                self.departureboard.hide()
-                self.noservices.update_state(self.__data)
-                self.noservices.show()
-            else:
-                self.noservices.hide()
-                self.departureboard.update_state(self.__data)
-                self.departureboard.show()
-    
-    def render(self, timestamp, ticks):
-        self.viewport.refresh()
-        self.show_image()
-        return
-    
-    def show_image(self):
-        if not Config.get("debug.dummy", False):
-            return
-        
-        utils.display_image("Departure Board", self.device.image)
\ No newline at end of file
+import os
+import threading
+import time
+from PIL import ImageFont
+from datetime import datetime, timedelta
+
+from trains.config import Config
+from trains.elements import *
+from trains.scenes import *
+from trains.scheduler import Scheduler, monotonic_deadline
+from trains.display import CountingSerial, DirtyViewport, PartialSSD1322
+from trains.glyphs import GlyphAtlas
+import trains.utils as utils
+
+from luma.core.interface.serial import spi
+from luma.core.device import dummy
+from luma.core.render import canvas
+from luma.oled.device import ssd1322
+from luma.core.virtual import viewport, snapshot, hotspot
+
+class Board:
+    hotspots = {}
+    elements = {}
+
+    def __init__(self, config=None, serial=None, fonts=None, name="Departure Board"):
+        self.name = name
+        self.__data = None
+        self.__newdata = None
+
+        # Bumped for each new state, so we only compare states when it changes
+        self.generation = 0
+        self.__generation = 0
+        self.config = config or Config.snapshot()
+        self.scheduler = Scheduler()
+
+        # A new config and the paths that changed, waiting for the render
+        # thread to apply them
+        self.pending_config = None
+        self.pending_lock = threading.Lock()
+
+        # When the board we're showing was saved, until live data replaces it
+        self.restored = None
+
+        # Fonts, and the glyphs cached in them, can be shared between boards
+        self.fonts = fonts or self.load_fonts()
+        self.init_display(serial)
+        self.init_powersaving()
+        self.tick_updates = []
+
+    def init_powersaving(self):
+        self.brightness = self.config.settings.brightness
+        self.sleeping = False
+        self.woken = False
+        # Show the initialising scene for at least this long
+        self.finish_init = datetime.now() + timedelta(seconds=self.config.debug.initialising)
+
+        self.load_powersaving()
+        self.update_powersaving(datetime.now())
+
+    def load_powersaving(self):
+        self.normal_brightness = self.config.settings.brightness
+
+        powersaving = self.config.settings.powersaving
+        self.powersaving_brightness = powersaving.brightness
+        self.powersaving_start = powersaving.start
+        self.powersaving_end = powersaving.end
+
+    def apply_config(self, config, changed):
+        # Apply a new configuration without restarting. This is called from
+        # the config thread, so it's left for the render thread to apply
+        # between frames in update_config.
+        with self.pending_lock:
+            if self.pending_config is not None:
+                changed = self.pending_config[1] | changed
+            self.pending_config = (config, changed)
+
+        self.scheduler.notify()
+
+    def update_config(self):
+        # Display settings such as debug.dummy and debug.bus_speed still
+        # need a restart
+        with self.pending_lock:
+            pending = self.pending_config
+            self.pending_config = None
+        if pending is None:
+            return
+
+        config, changed = pending
+        self.config = config
+        self.load_powersaving()
+
+        for scene in self.scenes:
+            scene.apply_config(changed)
+
+    def update_powersaving(self, timestamp):
+        powersaving = utils.in_window(self.powersaving_start, self.powersaving_end, timestamp.time())
+
+        # Nobody can see a display at zero brightness, so turn it off
+        if powersaving and self.powersaving_brightness == 0:
+            self.sleep()
+            return
+        if self.sleeping:
+            self.wake()
+
+        if powersaving and self.brightness != self.powersaving_brightness:
+            self.set_brightness(self.powersaving_brightness)
+        elif not powersaving and self.brightness != self.normal_brightness:
+            self.set_brightness(self.normal_brightness)
+
+    
+    def departure_board(self):
+        # Our scenes
+        self.clock = Clock(self)
+        self.initialising = Initialising(self)
+        self.noservices = NoServices(self)
+        self.departureboard = DepartureBoard(self)
+
+        self.tick_updates.append(self.initialising)
+        self.tick_updates.append(self.noservices)
+        self.tick_updates.append(self.departureboard)
+
+        self.scenes = [self.clock, self.initialising, self.noservices, self.departureboard]
+
+        if self.restored is None:
+            self.initialising.show()
+        else:
+            self.update_data(datetime.now(), 0)
+        self.viewport.refresh()
+        self.show_image()
+    
+    @staticmethod
+    def load_fonts():
+        return {
+            "regular": Board.load_font("Dot Matrix Regular.ttf", 10),
+            "bold": Board.load_font("Dot Matrix Bold.ttf", 10),
+            "boldtall": Board.load_font("Dot Matrix Bold Tall.ttf", 10),
+            "boldlarge": Board.load_font("Dot Matrix Bold.ttf", 20)
+        }
+    
+    @staticmethod
+    def load_font(font, size):
+        path = os.path.abspath(
+            os.path.join(
+                os.path.dirname(__file__),
+                '../'
+                'fonts',
+                font
+            )
+        )
+        return GlyphAtlas(ImageFont.truetype(path, size))
+    
+    def init_display(self, serial=None):
+        self.serial = None
+        if self.config.debug.dummy and not serial:
+            self.device = dummy(width=256, height=64, rotate=0, mode="1")
+        else:
+            if not serial:
+                debug = self.config.debug
+                serial = spi(port=debug.spi_port, device=debug.spi_device, gpio_DC=debug.gpio_dc, gpio_RST=debug.gpio_rst, bus_speed_hz=debug.bus_speed)
+            self.serial = CountingSerial(serial)
+            self.device = PartialSSD1322(self.serial, mode="1", rotate=0)
+        
+        self.viewport = DirtyViewport(self.device, width=self.device.width, height=self.device.height, pipeline=self.config.debug.pipeline)
+
+    def bus_rate(self):
+        # Bytes per second sent to the display
+        if not self.serial:
+            return 0
+        return self.serial.rate()
+
+    def frame_jitter(self):
+        # How unevenly frames reach the display, in seconds
+        return self.viewport.frames.jitter()
+    
+    def update_state(self, state):
+        self.__newdata = state
+        self.restored = None
+        self.generation += 1
+        self.scheduler.notify()
+
+    def restore(self, state, saved):
+        # Show a board saved before we restarted, without the initialising
+        # scene, until the first fetch replaces it
+        self.__newdata = state
+        self.restored = saved
+        self.finish_init = None
+        self.generation += 1
+
+    def update_stale(self, timestamp):
+        # Say when a restored board was fetched once it's getting old
+        restored = self.restored
+        if restored is not None and (timestamp - restored).total_seconds() >= self.config.debug.stale_age:
+            self.clock.set_note("Updated {0:%H:%M}".format(restored))
+        else:
+            self.clock.set_note(None)
+    
+    def sleep(self):
+        if self.sleeping:
+            return
+
+        self.sleeping = True
+        with self.viewport.bus:
+            self.device.hide()
+
+    def wake(self):
+        self.sleeping = False
+        with self.viewport.bus:
+            self.device.show()
+
+        # Hotspots have moved on since the display last saw them
+        self.woken = True
+        self.scheduler.notify()
+
+    def set_brightness(self, value):
+        self.brightness = value
+        with self.viewport.bus:
+            self.device.contrast(value)
+    
+    def update_data(self, timestamp, tick):
+        self.update_config()
+        self.update_powersaving(timestamp)
+
+        # Tick Updates
+        for scene in self.tick_updates:
+            scene.update_tick(timestamp, tick)
+        self.update_stale(timestamp)
+
+        if self.finish_init and timestamp < self.finish_init:
+            return
+        
+        if self.generation == self.__generation:
+            return
+        self.__generation = self.generation
+
+        # Only care if data has changed
+        if self.__newdata != self.__data:
+            self.__data = self.__newdata
+
+            self.finish_init = None
+            
+            self.initialising.hide()
+            self.clock.show()
+
+            if len(self.__data["departures"]) == 0:
+                self.departureboard.hide()
+                self.noservices.update_state(self.__data)
+                self.noservices.show()
+            else:
+                self.noservices.hide()
+                self.departureboard.update_state(self.__data)
+                self.departureboard.show()
+    
+    def render(self, timestamp, ticks):
+        if not self.should_redraw():
+            return False
+
+        self.viewport.refresh(force=self.woken, due=self.get_deadline())
+        self.woken = False
+        self.show_image()
+        return True
+
+    def should_redraw(self):
+        # Nothing is drawn while the display is off
+        if self.sleeping:
+            return False
+        if self.viewport.dirty or self.woken:
+            return True
+
+        for scene in self.scenes:
+            if scene.should_redraw():
+                return True
+        return False
+
+    def get_deadline(self):
+        if self.sleeping:
+            # Nothing to do until the display comes back on
+            return time.monotonic() + utils.seconds_until(self.powersaving_end, datetime.now())
+
+        deadlines = []
+        if self.finish_init and self.finish_init > datetime.now():
+            deadlines.append(monotonic_deadline(self.finish_init))
+
+        restored = self.restored
+        if restored is not None:
+            stale = restored + timedelta(seconds=self.config.debug.stale_age)
+            if stale > datetime.now():
+                deadlines.append(monotonic_deadline(stale))
+
+        for scene in self.scenes:
+            deadline = scene.get_deadline()
+            if deadline is not None:
+                deadlines.append(deadline)
+
+        return min(deadlines, default=None)
+
+    def wait(self):
+        # Sleep until the next hotspot needs redrawing, or new data arrives
+        self.scheduler.wait_until(self.get_deadline())
+    
+    def show_image(self):
+        if not self.config.debug.dummy or not self.config.debug.preview:
+            return
+        
+        utils.display_image(self.name, self.device.image)
\ No newline at end of file
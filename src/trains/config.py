@@ -1,45 +1,325 @@
-import json
-import pprint
-import os
-import requests
-
-from trains.utils import get_device_id
-
-class Config:
-    instance = None
-    __id = None
-
-    def __init__(self):
-        uid = get_device_id()
-        url = "https://trains.ariel.mintopia.net/{0}.json".format(uid)
-        response = requests.get(url)
-        self.config = response.json()
-    
-    def lookup(self, path):
-        keys = path.split(".")
-        return self.__lookup(keys, self.config)
-    
-    def __lookup(self, keys, config):
-        if len(keys) == 0:
-            return None
-        key = keys.pop(0)
-        if key in config:
-            if type(config[key]) is dict:
-                return self.__lookup(keys, config[key])
-            
-            return config[key]
-        return None
-
-
-    @staticmethod
-    def get(path, default=None):
-        if not Config.instance:
-            Config.instance = Config()
-        
-        result = Config.instance.lookup(path)
-        if result == None:
-            return default
-        return result
-
-if __name__ == "__main__":
-    print("Departure: {0}".format(Config.get("settings.departure")))
+import json
+import pprint
+import os
+import threading
+from datetime import time as dtt
+
+from trains.utils import get_device_id, cache_path, write_atomic
+
+def parse_bool(value):
+    if isinstance(value, str):
+        if value.lower() in ("true", "yes", "on", "1"):
+            return True
+        if value.lower() in ("false", "no", "off", "0", ""):
+            return False
+        raise ValueError("Not a boolean")
+    return bool(value)
+
+def parse_list(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return [str(item).strip() for item in value]
+
+def parse_clock_time(value):
+    hour, minute = str(value).split(":")[:2]
+    return dtt(hour=int(hour), minute=int(minute))
+
+def parse_mapping(value):
+    if not isinstance(value, dict):
+        raise ValueError("Not a mapping")
+    return value
+
+def parse_panels(value):
+    if not isinstance(value, list):
+        raise ValueError("Not a list")
+    return [parse_mapping(panel) for panel in value]
+
+# Every known configuration key with its parser and default
+SCHEMA = {
+    "settings": {
+        "departure": (str, None),
+        "destination": (str, None),
+        "platforms": (parse_list, []),
+        "tocs": (parse_list, []),
+        "services": (int, 3),
+        "cutoff": (float, 8),
+        "brightness": (int, None),
+        "powersaving": {
+            "start": (parse_clock_time, "01:00"),
+            "end": (parse_clock_time, "07:00"),
+            "brightness": (int, 0),
+        },
+        "layout": {
+            "headcodes": (parse_bool, False),
+            "times": (parse_bool, False),
+        },
+        "messages": {
+            "frequency": (int, 30),
+            "interval": (int, 5),
+        },
+    },
+    "replacements": (parse_mapping, {}),
+    # Settings for each extra display, over the top of the rest of the config
+    "panels": (parse_panels, []),
+    # Serving boards to other displays on the network, see proxy.py
+    "proxy": {
+        "host": (str, "0.0.0.0"),
+        "port": (int, 8080),
+        "ttl": (int, 30),
+        "horizon": (float, 12),
+    },
+    "debug": {
+        "stats": (parse_bool, False),
+        "frequency": (int, 60),
+        "adaptive": (parse_bool, True),
+        "min_frequency": (int, 20),
+        "max_frequency": (int, 300),
+        # How often to fetch while the display is off overnight
+        "sleep_frequency": (int, 1800),
+        "framerate": (int, 0),
+        "dummy": (parse_bool, False),
+        "preview": (parse_bool, True),
+        "bus_speed": (int, 16000000),
+        # Send frames from a separate thread while the next is drawn
+        "pipeline": (parse_bool, False),
+        "spi_port": (int, 0),
+        "spi_device": (int, 0),
+        "gpio_dc": (int, 24),
+        "gpio_rst": (int, 25),
+        "url": (str, None),
+        # A board proxy to fetch from instead of the board API, eg: http://pi.local:8080
+        "proxy": (str, None),
+        "connect_timeout": (float, 5),
+        "read_timeout": (float, 10),
+        "config_frequency": (int, 300),
+        # Seconds the initialising scene shows for at startup, 0 to show
+        # departures as soon as we have them
+        "initialising": (int, 5),
+        # Show the board saved before a restart if it's at most this many
+        # seconds old, 0 to always wait for a fetch
+        "restore_age": (int, 900),
+        # Show when a restored board was fetched once it's this old
+        "stale_age": (int, 120),
+    },
+}
+
+# A read-only section of compiled configuration, accessed by attribute
+class Section:
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Configuration is read-only")
+
+    def __repr__(self):
+        return "Section({0!r})".format(self.__dict__)
+
+# Compiles a config against the schema. Anything missing comes from `base`,
+# a compiled config, if we have one, otherwise the schema default.
+def compile_config(config, schema=SCHEMA, path=None, base=None):
+    if not isinstance(config, dict):
+        config = {}
+
+    values = {}
+    for key, spec in schema.items():
+        name = key if not path else "{0}.{1}".format(path, key)
+        if isinstance(spec, dict):
+            values[key] = compile_config(config.get(key), spec, name, getattr(base, key) if base else None)
+            continue
+
+        parser, default = spec
+        value = config.get(key)
+        if value is None and base is not None:
+            values[key] = getattr(base, key)
+            continue
+        if value is None:
+            value = default
+        if value is None:
+            values[key] = None
+            continue
+
+        try:
+            values[key] = parser(value)
+        except (TypeError, ValueError) as ex:
+            raise ValueError("Invalid configuration value for {0}: {1!r}".format(name, value)) from ex
+
+    return Section(values)
+
+def flatten(section, path=None):
+    values = {}
+    for key, value in section.__dict__.items():
+        name = key if not path else "{0}.{1}".format(path, key)
+        if isinstance(value, Section):
+            values.update(flatten(value, name))
+        else:
+            values[name] = value
+    return values
+
+# Dotted paths of every value that differs between two compiled configs
+def diff_config(old, new):
+    old = flatten(old)
+    new = flatten(new)
+    return set(key for key in new if old.get(key) != new[key])
+
+class Config:
+    instance = None
+    listeners = []
+    url = os.environ.get("DEPARTURE_BOARD_CONFIG_URL", "https://trains.ariel.mintopia.net/{0}.json")
+    __id = None
+
+    def __init__(self, config=None, path=None):
+        self.path = path
+        self.etag = None
+        self.modified = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+        if config is None:
+            # Start from the last good config on disk, only blocking on the
+            # network when we've never had one
+            self.path = path or cache_path("config.json")
+            config = self.load_cache()
+            if config is None:
+                # Errors from requests are OSErrors
+                try:
+                    config = self.fetch()
+                    self.save_cache(config)
+                except (OSError, ValueError):
+                    config = None
+        self.config = config or {}
+        self.compiled = compile_config(self.config)
+
+    def load_cache(self):
+        try:
+            with open(self.path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self.etag = cached.get("etag")
+        self.modified = cached.get("modified")
+        return cached.get("config")
+
+    def save_cache(self, config):
+        cached = {
+            "etag": self.etag,
+            "modified": self.modified,
+            "config": config,
+        }
+        write_atomic(self.path, json.dumps(cached))
+
+    def fetch(self):
+        # Only imported when we need it, as it's slow to import
+        import requests
+
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+
+        url = self.url.format(get_device_id())
+        response = requests.get(url, headers=headers, timeout=(5, 10))
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+
+        config = response.json()
+        self.etag = response.headers.get("ETag")
+        self.modified = response.headers.get("Last-Modified")
+        return config
+
+    def refresh(self):
+        config = self.fetch()
+        if config is None or config == self.config:
+            return set()
+
+        try:
+            compiled = compile_config(config)
+        except ValueError as ex:
+            # Keep running with the last good config
+            print("Unable to refresh config: {0}".format(ex))
+            return set()
+
+        self.save_cache(config)
+        changed = diff_config(self.compiled, compiled)
+
+        self.config = config
+        self.compiled = compiled
+        for listener in list(Config.listeners):
+            listener(compiled, changed)
+        return changed
+
+    def run(self, interval):
+        while True:
+            try:
+                self.refresh()
+            except (ValueError, OSError) as ex:
+                print("Unable to refresh config: {0}".format(ex))
+
+            if self.stopped.wait(interval):
+                return
+
+    def start(self, interval):
+        if self.thread or self.path is None:
+            return
+
+        self.thread = threading.Thread(target=self.run, args=(interval,), name="config", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+    
+    def lookup(self, path):
+        keys = path.split(".")
+        return self.__lookup(keys, self.config)
+    
+    def __lookup(self, keys, config):
+        if len(keys) == 0:
+            return None
+        key = keys.pop(0)
+        if key in config:
+            if type(config[key]) is dict:
+                return self.__lookup(keys, config[key])
+            
+            return config[key]
+        return None
+
+
+    @staticmethod
+    def load(config):
+        # Use a local configuration instead of fetching one, eg: for benchmarks
+        Config.instance = Config(config)
+
+    @staticmethod
+    def subscribe(listener):
+        # Called with the new compiled config and the paths that changed
+        Config.listeners.append(listener)
+
+    @staticmethod
+    def start_refresh(interval):
+        if not Config.instance:
+            Config.instance = Config()
+
+        Config.instance.start(interval)
+
+    @staticmethod
+    def snapshot():
+        # The compiled configuration, for attribute access in hot paths
+        if not Config.instance:
+            Config.instance = Config()
+
+        return Config.instance.compiled
+
+    @staticmethod
+    def get(path, default=None):
+        if not Config.instance:
+            Config.instance = Config()
+        
+        result = Config.instance.lookup(path)
+        if result == None:
+            return default
+        return result
+
+if __name__ == "__main__":
+    print("Departure: {0}".format(Config.get("settings.departure")))
@@ -1,57 +1,166 @@
-from trains.config import Config
-
-class Stop:
-    def __init__(self):
-        self.location = None
-        self.time = None
-
-class Departure:
-    def __init__(self):
-        self.stops = []
-        self.origin = None
-        self.destination = None
-        self.headcode = None
-        self.rid = None
-        self.toc = None
-        self.toc_name = None
-        self.platform = None
-        self.scheduled = None
-        self.actual = None
-        self.length = None
-        self.cancelled = False
-        self.bus = False
-        self.arrived = False
-    
-    def get_status_string(self):
-        if self.cancelled:
-            return "Cancelled"
-        elif self.arrived:
-            return "Arrived"
-        elif self.actual == self.scheduled:
-            return "On time"
-        else:
-            return "Exp {0}".format(self.actual)
-
-class Location:
-    def __init__(self):
-        self.name = None
-        self.crs = None
-        self.toc = None
-        self.toc_name = None
-    
-    def get_abbr_name(self):
-        output = self.name
-        replacements = Config.get("replacements")
-        if not replacements:
-            return output
-        for key in replacements.keys():
-            output = output.replace(key, replacements[key])
-        
-        return output
-
-class State:
-    def __init__(self):
-        self.name = None
-        self.location = None
-        self.departures = []
-        self.messages = []
+from collections.abc import Mapping
+
+# Immutable, slotted records. The scenes index these like dicts (eg:
+# departure["destination"]["abbr_name"]), so they're also a read-only
+# mapping over their fields rather than being copied into dicts.
+class Record(Mapping):
+    __slots__ = ()
+    defaults = {}
+    # Fields holding other records, by their type, or a one-tuple of the
+    # type for a tuple of them
+    nested = {}
+
+    def __init__(self, **values):
+        for field in self.__slots__:
+            if field in values:
+                value = values.pop(field)
+            else:
+                value = self.defaults.get(field)
+            object.__setattr__(self, field, value)
+
+        if values:
+            raise TypeError("Unknown fields for {0}: {1}".format(type(self).__name__, ", ".join(values.keys())))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{0} is immutable".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{0} is immutable".format(type(self).__name__))
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    # Plain values for JSON, leaving out any that are the default
+    def to_dict(self):
+        values = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is None or value == self.defaults.get(field):
+                continue
+
+            if isinstance(value, Record):
+                value = value.to_dict()
+            elif isinstance(value, tuple):
+                value = [item.to_dict() if isinstance(item, Record) else item for item in value]
+            values[field] = value
+        return values
+
+    @classmethod
+    def from_dict(cls, values):
+        fields = {}
+        for field, value in values.items():
+            kind = cls.nested.get(field)
+            if isinstance(kind, tuple):
+                value = tuple(kind[0].from_dict(item) for item in value)
+            elif kind is not None:
+                value = kind.from_dict(value)
+            elif isinstance(value, list):
+                value = tuple(value)
+            fields[field] = value
+        return cls(**fields)
+
+    def values_tuple(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(self) is not type(other):
+            return NotImplemented
+        return self.values_tuple() == other.values_tuple()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self.values_tuple())
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__, ", ".join("{0}={1!r}".format(field, getattr(self, field)) for field in self.__slots__))
+
+# The fields that differ between two records of the same type
+def changed_fields(old, new):
+    return frozenset(field for field in new.__slots__ if getattr(old, field) != getattr(new, field))
+
+# Departures compared by rid. `changed` has the changed fields of each service
+# on both boards, and `same_services` is whether the services and their order
+# are the same, so the changes can be drawn in place.
+class DepartureDiff:
+    def __init__(self, old, new):
+        old = old or ()
+        new = new or ()
+        self.same_services = [departure["rid"] for departure in old] == [departure["rid"] for departure in new]
+
+        previous = dict((departure["rid"], departure) for departure in old)
+        self.changed = {}
+        for departure in new:
+            before = previous.get(departure["rid"])
+            if before is not None and before != departure:
+                self.changed[departure["rid"]] = changed_fields(before, departure)
+
+class Stop(Record):
+    __slots__ = ("location", "time")
+
+class Departure(Record):
+    __slots__ = (
+        "rid", "headcode", "toc", "toc_name", "platform", "scheduled", "actual",
+        "length", "cancelled", "cancel_reason", "late_reason", "bus", "arrived",
+        "origin", "destination", "stops", "status",
+    )
+    defaults = {
+        "cancelled": False,
+        "bus": False,
+        "arrived": False,
+        "stops": (),
+    }
+
+    def __init__(self, **values):
+        super(Departure, self).__init__(**values)
+
+        if self.status is None:
+            object.__setattr__(self, "status", self.get_status_string())
+
+    def get_status_string(self):
+        if self.cancelled:
+            return "Cancelled"
+        elif self.arrived:
+            return "Arrived"
+        elif self.actual == self.scheduled:
+            return "On time"
+        else:
+            return "Exp {0}".format(self.actual)
+
+class Location(Record):
+    __slots__ = ("name", "crs", "toc", "toc_name", "abbr_name")
+
+    @staticmethod
+    def abbreviate(name, replacements):
+        output = name
+        if not replacements:
+            return output
+        for key in replacements.keys():
+            output = output.replace(key, replacements[key])
+
+        return output
+
+class State(Record):
+    __slots__ = ("name", "location", "departures", "messages")
+    defaults = {
+        "departures": (),
+        "messages": (),
+    }
+
+Stop.nested = {"location": Location}
+Departure.nested = {"origin": Location, "destination": Location, "stops": (Stop,)}
+State.nested = {"location": Location, "departures": (Departure,)}
@@ -0,0 +1,385 @@
+import math
+import threading
+import time
+
+from PIL import Image
+from luma.core.framebuffer import full_frame
+from luma.core.virtual import viewport
+from luma.oled.device import ssd1322
+
+# Slack, in pixels, we'll send to merge two dirty regions into one window
+# rather than paying for another set of address commands
+MERGE_SLACK = 64
+
+# The SSD1322 addresses columns in groups of 4 pixels
+def align_region(region):
+    left, top, right, bottom = region
+    left = left & ~3
+    if right % 4:
+        right = (right & ~3) + 4
+    return (left, top, right, bottom)
+
+def region_area(region):
+    return (region[2] - region[0]) * (region[3] - region[1])
+
+def region_union(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+def merge_regions(regions):
+    regions = [align_region(region) for region in regions]
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                union = region_union(regions[i], regions[j])
+                if region_area(union) <= region_area(regions[i]) + region_area(regions[j]) + MERGE_SLACK:
+                    regions[i] = union
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    return regions
+
+# The parts of a hotspot changed by its last redraw, on the viewport. Hotspots
+# can say with `regions`, otherwise it's all of it.
+def hotspot_regions(hotspot, xy):
+    regions = getattr(hotspot, "regions", None)
+    if regions is None:
+        return [(xy[0], xy[1], xy[0] + hotspot.width, xy[1] + hotspot.height)]
+    return [(xy[0] + left, xy[1] + top, xy[0] + right, xy[1] + bottom) for left, top, right, bottom in regions]
+
+# Wraps a luma serial interface and counts the bytes sent over it
+class CountingSerial:
+    def __init__(self, serial):
+        self.serial = serial
+        self.bytes = 0
+        self.last_bytes = 0
+        self.last_time = time.monotonic()
+
+    def command(self, *cmd):
+        self.bytes += len(cmd)
+        self.serial.command(*cmd)
+
+    def data(self, data):
+        self.bytes += len(data)
+        self.serial.data(data)
+
+    def cleanup(self):
+        self.serial.cleanup()
+
+    def rate(self):
+        # Bytes per second since we were last asked
+        now = time.monotonic()
+        elapsed = now - self.last_time
+        rate = (self.bytes - self.last_bytes) / elapsed if elapsed > 0 else 0
+
+        self.last_bytes = self.bytes
+        self.last_time = now
+        return rate
+
+# How late frames reach the display after they were due, to show how
+# evenly animations such as scrolling move
+class FrameTimes:
+    def __init__(self, size=256):
+        self.size = size
+        self.lateness = []
+
+    def record(self, due=None):
+        if due is None:
+            return
+        self.lateness.append(max(time.monotonic() - due, 0))
+        del self.lateness[:-self.size]
+
+    def reset(self):
+        self.lateness = []
+
+    def average(self):
+        if not self.lateness:
+            return 0.0
+        return sum(self.lateness) / len(self.lateness)
+
+    def percentile(self, fraction):
+        if not self.lateness:
+            return 0.0
+        ordered = sorted(self.lateness)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def jitter(self):
+        # The standard deviation of how late frames are, in seconds
+        if len(self.lateness) < 2:
+            return 0.0
+        mean = self.average()
+        return math.sqrt(sum((late - mean) ** 2 for late in self.lateness) / len(self.lateness))
+
+# Sends frames to the display from its own thread, so the next frame can be
+# composed while this one is on the bus. Only the latest frame waits to be
+# sent: a newer one replaces it, taking on its dirty regions too.
+class FrameSender:
+    def __init__(self, device, frames=None, bus=None):
+        self.device = device
+        self.frames = frames or FrameTimes()
+        self.bus = bus or threading.Lock()
+        self.condition = threading.Condition()
+        self.pending = None
+        self.sending = False
+        self.sent = 0
+        self.dropped = 0
+        self.stopped = False
+
+        self.thread = threading.Thread(target=self.run, name="display", daemon=True)
+        self.thread.start()
+
+    def submit(self, image, regions=None, due=None):
+        # No regions means a full frame
+        with self.condition:
+            if self.pending is not None:
+                self.dropped += 1
+                _, pending, pending_due = self.pending
+                regions = None if pending is None or regions is None else pending + regions
+                # This frame is as late as the one it replaces
+                if pending_due is not None:
+                    due = pending_due if due is None else min(due, pending_due)
+            self.pending = (image, regions, due)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                image, regions, due = self.pending
+                self.pending = None
+                self.sending = True
+
+            with self.bus:
+                if regions is None:
+                    self.device.display(image)
+                else:
+                    self.device.display_regions(image, merge_regions(regions))
+            self.frames.record(due)
+
+            with self.condition:
+                self.sent += 1
+                self.sending = False
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        # Wait until everything we've been given is on the display
+        with self.condition:
+            return self.condition.wait_for(lambda: self.pending is None and not self.sending, timeout)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+# A stand-in serial interface that records the command and data stream
+class RecordingSerial:
+    def __init__(self):
+        self.stream = []
+
+    def command(self, *cmd):
+        self.stream.append(("command", cmd))
+
+    def data(self, data):
+        self.stream.append(("data", bytes(data)))
+
+    def cleanup(self):
+        return
+
+# Packs 1-bit frames into the SSD1322's 4-bit GDDRAM format with a lookup
+# table from each byte of 8 pixels to the 4 bytes they become, and keeps what
+# was last sent so unchanged regions needn't be sent again
+class FramePacker:
+    def __init__(self, lut, width, height):
+        self.lut = lut
+        self.stride = width >> 1
+        self.height = height
+        self.frame = bytearray(self.stride * height)
+        self.sent = None
+
+    def pack(self, image):
+        self.frame[:] = b"".join([self.lut[byte] for byte in image.tobytes()])
+
+    def rows(self, frame, region):
+        left, top, right, bottom = region
+        for row in range(top, bottom):
+            start = row * self.stride
+            yield frame[start + (left >> 1):start + (right >> 1)]
+
+    def region(self, region):
+        return b"".join(self.rows(self.frame, region))
+
+    def changed(self, region):
+        if self.sent is None:
+            return True
+        return any(new != old for new, old in zip(self.rows(self.frame, region), self.rows(self.sent, region)))
+
+    def mark_sent(self, region):
+        if self.sent is None:
+            self.sent = bytearray(len(self.frame))
+        left, top, right, bottom = region
+        for row in range(top, bottom):
+            start = row * self.stride
+            self.sent[start + (left >> 1):start + (right >> 1)] = self.frame[start + (left >> 1):start + (right >> 1)]
+
+# The same, vectorised with NumPy into a buffer we reuse for every frame
+class NumpyFramePacker(FramePacker):
+    def __init__(self, numpy, lut, width, height):
+        self.numpy = numpy
+        self.lut = numpy.frombuffer(b"".join(lut), dtype=numpy.uint8).reshape(256, 4)
+        self.stride = width >> 1
+        self.height = height
+        self.packed = numpy.zeros((self.stride * height >> 2, 4), dtype=numpy.uint8)
+        self.frame = self.packed.reshape(height, self.stride)
+        self.sent = None
+
+    def pack(self, image):
+        pixels = self.numpy.frombuffer(image.tobytes(), dtype=self.numpy.uint8)
+        self.numpy.take(self.lut, pixels, axis=0, out=self.packed)
+
+    def block(self, frame, region):
+        left, top, right, bottom = region
+        return frame[top:bottom, left >> 1:right >> 1]
+
+    def region(self, region):
+        return self.block(self.frame, region).tobytes()
+
+    def changed(self, region):
+        if self.sent is None:
+            return True
+        return not self.numpy.array_equal(self.block(self.frame, region), self.block(self.sent, region))
+
+    def mark_sent(self, region):
+        if self.sent is None:
+            self.sent = self.numpy.zeros_like(self.frame)
+        self.block(self.sent, region)[:] = self.block(self.frame, region)
+
+    @staticmethod
+    def upgrade(numpy, packer):
+        # Carry on from a FramePacker, remembering what it sent
+        upgraded = NumpyFramePacker(numpy, packer.lut, packer.stride << 1, packer.height)
+        if packer.sent is not None:
+            upgraded.sent = numpy.frombuffer(bytes(packer.sent), dtype=numpy.uint8).reshape(packer.height, packer.stride).copy()
+        return upgraded
+
+# An SSD1322 that can write just part of its GDDRAM
+class PartialSSD1322(ssd1322):
+    def __init__(self, serial_interface=None, **kwargs):
+        self.packer = None
+        self.numpy = None
+        self.skipped = 0
+
+        # We track changes ourselves, so full frames really are full
+        kwargs.setdefault("framebuffer", full_frame())
+        super(PartialSSD1322, self).__init__(serial_interface, **kwargs)
+
+        # NumPy is slow to import, so we pack without it until it's loaded
+        threading.Thread(target=self.load_numpy, name="numpy", daemon=True).start()
+
+    def load_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            return
+        self.numpy = numpy
+
+    def get_packer(self):
+        if self.packer is None:
+            # Work the table out with luma's own packing, so we match it
+            lut = []
+            for byte in range(256):
+                buf = bytearray(4)
+                self._render_mono(buf, Image.frombytes("1", (8, 1), bytes([byte])).getdata())
+                lut.append(bytes(buf))
+            self.packer = FramePacker(lut, self.width, self.height)
+
+        if self.numpy is not None and not isinstance(self.packer, NumpyFramePacker):
+            self.packer = NumpyFramePacker.upgrade(self.numpy, self.packer)
+        return self.packer
+
+    def display(self, image):
+        if self.mode != "1":
+            super(PartialSSD1322, self).display(image)
+            return
+        self.display_regions(image, [(0, 0, self.width, self.height)])
+
+    def pack(self, image):
+        packer = self.get_packer()
+        packer.pack(self.preprocess(image))
+        return packer
+
+    def display_regions(self, image, regions):
+        packer = self.pack(image)
+
+        for region in regions:
+            # Don't send what the display already has
+            if not packer.changed(region):
+                self.skipped += 1
+                continue
+
+            left, top, right, bottom = region
+            self._set_position(top, right, bottom, left)
+            self.data(packer.region(region))
+            packer.mark_sent(region)
+
+# A viewport that tracks which hotspots changed, and only sends those
+# regions to devices that support partial updates
+class DirtyViewport(viewport):
+    def __init__(self, device, width, height, mode=None, partial=True, pipeline=False):
+        super(DirtyViewport, self).__init__(device, width, height, mode=mode)
+        self.partial = partial
+        self.dirty = []
+
+        # Held while talking to the display, as brightness changes come
+        # from other threads
+        self.bus = threading.Lock()
+        self.frames = FrameTimes()
+        self.sender = FrameSender(device, self.frames, self.bus) if pipeline else None
+
+    def add_hotspot(self, hotspot, xy):
+        super(DirtyViewport, self).add_hotspot(hotspot, xy)
+        self.dirty.append((xy[0], xy[1], xy[0] + hotspot.width, xy[1] + hotspot.height))
+
+    def remove_hotspot(self, hotspot, xy):
+        super(DirtyViewport, self).remove_hotspot(hotspot, xy)
+        self.dirty.append((xy[0], xy[1], xy[0] + hotspot.width, xy[1] + hotspot.height))
+
+    def refresh(self, force=False, due=None):
+        # `due` is when the frame should have been shown, on the monotonic clock
+        dirty = self.dirty
+        self.dirty = []
+
+        for hotspot, xy in self._hotspots:
+            if hotspot.should_redraw() and self.is_overlapping_viewport(hotspot, xy):
+                hotspot.paste_into(self._backing_image, xy)
+                dirty.extend(hotspot_regions(hotspot, xy))
+
+        if not dirty and not force:
+            return
+
+        if force or not self.partial or not hasattr(self._device, "display_regions"):
+            # Cropping copies the frame, so we can carry on drawing into ours
+            image = self._backing_image.crop(box=self._crop_box())
+            regions = None
+        else:
+            image = self._backing_image.copy() if self.sender else self._backing_image
+            regions = dirty
+
+        if self.sender:
+            self.sender.submit(image, regions, due)
+            return
+
+        with self.bus:
+            if regions is None:
+                self._device.display(image)
+            else:
+                self._device.display_regions(image, merge_regions(regions))
+        self.frames.record(due)
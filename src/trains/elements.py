@@ -1,371 +1,556 @@
-import math
-import time
-from datetime import datetime
-from pprint import pprint
-
-import trains.utils as utils
-from trains.config import Config
-
-from luma.core.virtual import hotspot, snapshot
-from PIL import Image, ImageDraw
-
-# A standard display clock
-class Clock(snapshot):
-    def __init__(self, width, height, fonts, draw_fn=None, interval=1.0):
-        super(Clock, self).__init__(width, height, draw_fn, interval)
-
-        self.fonts = fonts
-
-    def update(self, draw):
-        time = datetime.now().time()
-        hour, minute, seconds = str(time).split('.')[0].split(':')
-        hourmin = "{0}:{1}".format(hour, minute)
-        seconds = ":{0}".format(seconds)
-        
-        w1, h1 = draw.textsize(hourmin, self.fonts["boldlarge"])
-        w2, h2 = draw.textsize(":00", self.fonts["boldtall"])
-
-        margin = (self.width - w1 - w2) / 2
-
-        draw.text((margin, 0), text=hourmin, font=self.fonts["boldlarge"], fill="yellow")
-        draw.text((margin + w1, 5), text=seconds, font=self.fonts["boldtall"], fill="yellow")
-
-# Static text that does not re-render unless asked for
-class StaticText(snapshot):
-    renderedText = None
-    text = None
-    align = "left"
-    rendered = None
-
-    def __init__(self, width, height, font, mode, draw_fn=None, interval=1.0, text=None, align="left", spacing=2, vertical_align="top"):
-        super(StaticText, self).__init__(width, height, draw_fn, interval)
-
-        self.font = font
-        self.align = align
-        self.vertical_align = vertical_align
-        self.mode = mode
-        self.spacing = spacing
-        self.update_required = False
-
-        self.update_text(text)
-
-    def should_redraw(self):
-        # We re-render every minute
-        if self.rendered and time.monotonic() - 60 > self.rendered:
-            return True
-        
-        return self.update_required or self.renderedText != self.text
-
-    def update_text(self, text):
-        self.text = text
-
-        self.text_image = Image.new(self.mode, self.size)
-
-        size = self.font.getsize_multiline(self.text, spacing=self.spacing)
-
-        xpos = 0
-        if self.align == "right":
-            xpos = self.width - size[0]
-        elif self.align == "center":
-            xpos = math.floor((self.width - size[0]) / 2)
-        
-        ypos = 0
-        if self.vertical_align == "bottom":
-            ypos = self.height - size[1]
-        elif self.vertical_align == "middle":
-            ypos = math.floor((self.height - size[1]) / 2)
-
-        canvas = ImageDraw.Draw(self.text_image)
-        canvas.text((xpos, ypos), text=self.text, font=self.font, fill="yellow", align=self.align, spacing=self.spacing)
-
-        self.rendered = time.monotonic()
-
-    def paste_into(self, image, xy):
-        if not self.should_redraw():
-            return
-        
-        self.update_required = False
-        self.renderedText = self.text
-        image.paste(self.text_image, xy)
-
-
-class ScrollingText(snapshot):
-    def __init__(self, width, height, font, mode, text="", draw_fn=None, interval=1.0, align="left"):
-        super(ScrollingText, self).__init__(width, height, draw_fn, interval)
-        self.font = font
-        self.rendered_text = None
-        self.mode = mode
-        self.text = None
-        self.align = align
-
-        if text:
-            self.update_text(text)
-    
-    def reset(self):
-        if not self.text:
-            return
-        
-        self.ypos = self.height
-        self.top = 0
-        self.bottom = 0
-        self.left = 0
-        self.right = min(self.width, self.text.width)
-        self.last_updated = time.monotonic()
-    
-    def update_text(self, text):
-        if text == self.rendered_text:
-            return
-
-        self.rendered_text = text
-        
-        text_size = self.font.getsize(text)
-
-        if self.text:
-            del self.text
-        
-        self.text = Image.new(self.mode, text_size)
-
-        canvas = ImageDraw.Draw(self.text)
-        canvas.text((0, 0), text=text, font=self.font, fill="yellow")
-
-        self.xpos = 0
-        if text_size[0] <= self.width:
-            if self.align == "right":
-                self.xpos = self.width - text_size[0]
-            elif self.align == "center":
-                self.xpos = math.floor((self.width - text_size[0]) / 2)
-
-        self.reset()
-    
-    def paste_into(self, image, xy):
-        pause = 0
-
-        if self.text:
-            im = Image.new(image.mode, self.size)
-
-            if self.ypos <= 2 and self.ypos > 0:
-                if self.text.width <= self.width:
-                    # Our text fits in the viewport and we've finished scrolling
-                    # we don't need to update for a minute
-                    pause = 60
-                else:
-                    # Our text doesn't fit, but we want to scroll left in 2 seconds
-                    pause = 2
-            
-            if self.left >= (self.right - 1):
-                # We've finished scrolling left to right. We pause for 2 seconds
-                pause = 2
-
-            self.update_location()
-
-            im.paste(self.text.crop((self.left, self.top, self.right, self.bottom)), (self.xpos, self.ypos))
-            image.paste(im, xy)
-            del im
-
-        self.last_updated = time.monotonic() + pause
-    
-    def should_redraw(self):
-        if not self.text:
-            return False
-        
-        return super(ScrollingText, self).should_redraw()
-    
-    def update_location(self):
-        if not self.text:
-            return
-        
-        if self.bottom < self.height:
-            # Y Scroll
-            self.bottom += 2
-            self.ypos -= 2
-
-        elif self.text.width >= self.width:
-            # Y scrolling
-            self.left += 1
-            if self.right < self.text.width:
-                self.right += 1
-
-            if self.right <= self.left:
-                # Scroll finished
-                self.reset()
-        return
-    
-class NextService(snapshot):
-    def __init__(self, font, mode, data=None):
-        super(NextService, self).__init__(256, 12, None, 0.04)
-
-        self.font = font
-        self.mode = mode
-
-        self.rendered_data = None
-        self.text = None
-
-        if data:
-            self.update_data(data)
-    
-    def reset(self):
-        if not self.text:
-            return
-        
-        self.ypos = self.height
-        self.bottom = 0
-        self.last_updated = time.monotonic()
-    
-    def update_data(self, data):
-        if data == self.rendered_data:
-            return
-
-        self.rendered_data = data
-
-        if self.text:
-            del self.text
-        
-        self.text = Image.new(self.mode, self.size)
-        canvas = ImageDraw.Draw(self.text)
-        render_departure(canvas, self.font, 1, data)
-
-        self.reset()
-    
-    def paste_into(self, image, xy):
-        pause = 0
-
-        if self.text:
-            im = Image.new(image.mode, self.size)
-
-            if self.bottom < self.height:
-                # Y Scroll
-                self.bottom += 2
-                self.ypos -= 2
-            else:
-                # Pause rendering for a minute
-                pause = 60
-
-            im.paste(self.text.crop((0, 0, self.text.width, self.bottom)), (0, self.ypos))
-            image.paste(im, xy)
-            del im
-
-        self.last_updated = time.monotonic() + pause
-    
-    def should_redraw(self):
-        if not self.text:
-            return False
-        
-        return super(NextService, self).should_redraw()
-
-class RemainingServices(snapshot):
-    def __init__(self, font, mode, data=None):
-        super(RemainingServices, self).__init__(256, 12, None, 0.04)
-
-        self.font = font
-        self.mode = mode
-
-        self.rendered_data = None
-        self.text = None
-
-        if data:
-            self.update_data(data)
-    
-    def reset(self):
-        if not self.text:
-            return
-        
-        self.ypos = self.height
-        self.bottom = 0
-        self.top = 0
-        self.ystart = 0
-
-        self.last_updated = time.monotonic()
-    
-    def update_data(self, data):
-        if data == self.rendered_data:
-            return
-
-        self.rendered_data = data
-        if not data:
-            return
-
-        if self.text:
-            del self.text
-        
-        self.text = Image.new(self.mode, (self.width, (len(data) + 2) * 12))
-        canvas = ImageDraw.Draw(self.text)
-
-        i = 1
-        for departure in data:
-            render_departure(canvas, self.font, i + 1, departure, ypos=12 * i)
-            i += 1
-        
-        # Render last item again for easier scrolling
-        render_departure(canvas, self.font, 2, data[0], 12 * i)
-
-        self.reset()
-    
-    def paste_into(self, image, xy):
-        pause = 0
-
-        if self.text:
-            im = Image.new(image.mode, self.size)
-
-            self.update_location()
-            if self.top > 0 and self.top % 12 == 0:
-                pause = 5
-
-            im.paste(self.text.crop((0, self.top, self.text.width, self.bottom)), (0, self.ypos))
-            image.paste(im, xy)
-            del im
-
-            if self.bottom >= self.text.height:
-                # We've hit the bottom
-                self.top = 12
-                self.bottom = 24
-
-        self.last_updated = time.monotonic() + pause
-    
-    def should_redraw(self):
-        if not self.text:
-            return False
-        
-        return super(RemainingServices, self).should_redraw()
-    
-    def update_location(self):
-        if not self.text:
-            return
-        
-        if self.ypos > 0:
-            # We're scrolling up our initial scroll
-            self.ypos -= 2
-            self.bottom += 2
-        else:
-            self.top += 2
-            self.bottom += 2
-
-
-def render_departure(canvas, font, order=1, departure=None, ypos=0):
-    if not departure:
-        return
-    
-    # Order: Left
-    canvas.text((0, ypos), text=utils.ordinal(order), font=font, fill="yellow")
-
-    # Scheduled: Center
-    align = utils.align(font, departure["scheduled"], 28, "center")
-    canvas.text((17 + align, ypos), text=departure["scheduled"], font=font, fill="yellow")
-
-    # Headcode: Optional
-    xpos = 0
-    if Config.get("settings.layout.headcodes"):
-        xpos += 27
-        align = utils.align(font, departure["headcode"], 27, "center")
-        canvas.text((45 + align, ypos), text=departure["headcode"], font=font, fill="yellow")
-
-    # Platform: Center
-    align = utils.align(font, departure["platform"], 19, "center")
-    canvas.text((45 + align + xpos, ypos), text=departure["platform"], font=font, fill="yellow")
-
-    # Destination: Left
-    canvas.text((64 + xpos, ypos), text=departure["destination"]["abbr_name"], font=font, fill="yellow")
-
-    # Status: Right
-    align = utils.align(font, departure["status"], 40, "right")
-    canvas.text((216 + align, ypos), text=departure["status"], font=font, fill="yellow")
-    
+import math
+import time
+from datetime import datetime
+from pprint import pprint
+
+import trains.utils as utils
+from trains.data import DepartureDiff, changed_fields
+
+from luma.core.virtual import hotspot, snapshot
+from PIL import Image
+
+# The fields of a departure that render_departure draws. A change to any
+# other field, eg: its calling points, leaves its row as it is.
+ROW_FIELDS = frozenset(("scheduled", "headcode", "platform", "destination", "status"))
+
+# When a hotspot next wants to be redrawn, on the time.monotonic() clock
+def get_deadline(hotspot):
+    if hasattr(hotspot, "get_deadline"):
+        return hotspot.get_deadline()
+
+    return hotspot.last_updated + hotspot.interval
+
+# A standard display clock. The hours and minutes are laid out and drawn once
+# a minute, and the seconds are pasted from sprites drawn up front, so each
+# second only changes the seconds and is only redrawn when they change.
+class Clock(snapshot):
+    def __init__(self, width, height, fonts, draw_fn=None, interval=1.0):
+        super(Clock, self).__init__(width, height, draw_fn, interval)
+
+        self.fonts = fonts
+        # Shown to the left of the time, eg: how old the board is
+        self.note = None
+
+        self.buffer = Image.new("1", self.size)
+        self.seconds_width = fonts["boldtall"].getlength(":00")
+        self.sprites = [self.render_seconds(second) for second in range(60)]
+
+        # The second shown, as a timestamp, the minute it's laid out for and
+        # where the seconds go
+        self.second = None
+        self.minute = None
+        self.seconds_left = 0
+        # The parts of the clock that changed in the last redraw, or None for
+        # all of it
+        self.regions = None
+
+    def render_seconds(self, second):
+        sprite = Image.new("1", (self.seconds_width, self.height))
+        self.fonts["boldtall"].draw(sprite, (0, 5), ":{0:02d}".format(second))
+        return sprite
+
+    def set_note(self, note):
+        if note == self.note:
+            return
+
+        self.note = note
+        self.second = None
+        self.minute = None
+
+    def should_redraw(self):
+        return int(time.time()) != self.second
+
+    def get_deadline(self):
+        if self.second is None:
+            return time.monotonic()
+
+        # The start of the next second
+        return time.monotonic() + self.second + 1 - time.time()
+
+    def layout(self, minute):
+        self.minute = minute
+        hourmin = "{0:%H:%M}".format(minute)
+        w1 = self.fonts["boldlarge"].getlength(hourmin)
+        margin = (self.width - w1 - self.seconds_width) / 2
+
+        self.buffer.paste(0, (0, 0, self.width, self.height))
+        self.fonts["boldlarge"].draw(self.buffer, (margin, 0), hourmin)
+        if self.note:
+            self.fonts["regular"].draw(self.buffer, (0, 4), self.note)
+        self.seconds_left = int(margin + w1)
+
+    def draw(self, now):
+        minute = now.replace(second=0, microsecond=0)
+        if minute != self.minute:
+            self.layout(minute)
+            self.regions = None
+        else:
+            self.regions = [(self.seconds_left, 0, self.seconds_left + self.seconds_width, self.height)]
+
+        self.buffer.paste(self.sprites[now.second], (self.seconds_left, 0))
+
+    def paste_into(self, image, xy):
+        second = int(time.time())
+        self.draw(datetime.fromtimestamp(second))
+        image.paste(self.buffer, xy)
+
+        self.second = second
+        self.last_updated = time.monotonic()
+
+# Static text that does not re-render unless asked for
+class StaticText(snapshot):
+    renderedText = None
+    text = None
+    align = "left"
+    rendered = None
+
+    def __init__(self, width, height, font, mode, draw_fn=None, interval=1.0, text=None, align="left", spacing=2, vertical_align="top"):
+        super(StaticText, self).__init__(width, height, draw_fn, interval)
+
+        self.font = font
+        self.align = align
+        self.vertical_align = vertical_align
+        self.mode = mode
+        self.spacing = spacing
+        self.update_required = False
+
+        self.update_text(text)
+
+    def should_redraw(self):
+        # We re-render every minute
+        if self.rendered and time.monotonic() - 60 > self.rendered:
+            return True
+        
+        return self.update_required or self.renderedText != self.text
+
+    def get_deadline(self):
+        if self.update_required or self.renderedText != self.text:
+            return time.monotonic()
+
+        return self.rendered + 60
+
+    def update_text(self, text):
+        self.text = text
+
+        self.text_image = Image.new(self.mode, self.size)
+
+        size = self.font.getsize_multiline(self.text, spacing=self.spacing)
+
+        xpos = 0
+        if self.align == "right":
+            xpos = self.width - size[0]
+        elif self.align == "center":
+            xpos = math.floor((self.width - size[0]) / 2)
+        
+        ypos = 0
+        if self.vertical_align == "bottom":
+            ypos = self.height - size[1]
+        elif self.vertical_align == "middle":
+            ypos = math.floor((self.height - size[1]) / 2)
+
+        self.font.draw(self.text_image, (xpos, ypos), self.text, align=self.align, spacing=self.spacing)
+
+        self.rendered = time.monotonic()
+
+    def paste_into(self, image, xy):
+        if not self.should_redraw():
+            return
+        
+        self.update_required = False
+        self.renderedText = self.text
+        self.rendered = time.monotonic()
+        image.paste(self.text_image, xy)
+
+
+class ScrollingText(snapshot):
+    def __init__(self, width, height, font, mode, text="", draw_fn=None, interval=1.0, align="left"):
+        super(ScrollingText, self).__init__(width, height, draw_fn, interval)
+        self.font = font
+        self.rendered_text = None
+        self.mode = mode
+        self.text = None
+        self.align = align
+        self.changed = False
+
+        # Frames are composed here rather than in a new image every frame
+        self.buffer = Image.new(mode, self.size)
+
+        if text:
+            self.update_text(text)
+    
+    def reset(self):
+        if not self.text:
+            return
+        
+        self.ypos = self.height
+        self.top = 0
+        self.bottom = 0
+        self.left = 0
+        self.right = min(self.width, self.text.width)
+        self.last_updated = time.monotonic()
+    
+    def update_text(self, text, keep_position=False):
+        if text == self.rendered_text:
+            return
+
+        # Only keep scrolling from where we were if we're still inside the new text
+        keep_position = keep_position and self.text is not None and text
+
+        self.rendered_text = text
+        
+        text_size = self.font.getsize(text)
+
+        if self.text:
+            del self.text
+        
+        self.text = Image.new(self.mode, text_size)
+
+        self.font.draw(self.text, (0, 0), text)
+
+        self.xpos = 0
+        if text_size[0] <= self.width:
+            if self.align == "right":
+                self.xpos = self.width - text_size[0]
+            elif self.align == "center":
+                self.xpos = math.floor((self.width - text_size[0]) / 2)
+
+        if keep_position and (self.left == 0 or self.left < text_size[0] - self.width):
+            self.right = min(self.right, text_size[0])
+            self.changed = True
+            return
+
+        self.changed = False
+        self.reset()
+    
+    def compose(self, image, xy):
+        # Pasting the whole strip offset into our buffer clips it to the
+        # same window as cropping it would, without allocating
+        self.buffer.paste(0, (0, 0, self.width, self.height))
+        self.buffer.paste(self.text, (self.xpos - self.left, self.ypos - self.top))
+        image.paste(self.buffer, xy)
+
+    def paste_into(self, image, xy):
+        if self.changed and self.text and not super(ScrollingText, self).should_redraw():
+            # Show the change without moving the scroll on
+            self.changed = False
+            self.compose(image, xy)
+            return
+
+        self.changed = False
+        pause = 0
+
+        if self.text:
+            if self.ypos <= 2 and self.ypos > 0:
+                if self.text.width <= self.width:
+                    # Our text fits in the viewport and we've finished scrolling
+                    # we don't need to update for a minute
+                    pause = 60
+                else:
+                    # Our text doesn't fit, but we want to scroll left in 2 seconds
+                    pause = 2
+            
+            if self.left >= (self.right - 1):
+                # We've finished scrolling left to right. We pause for 2 seconds
+                pause = 2
+
+            self.update_location()
+            self.compose(image, xy)
+
+        self.last_updated = time.monotonic() + pause
+    
+    def should_redraw(self):
+        if not self.text:
+            return False
+        
+        return self.changed or super(ScrollingText, self).should_redraw()
+
+    def get_deadline(self):
+        if not self.text:
+            return None
+        if self.changed:
+            return time.monotonic()
+
+        return self.last_updated + self.interval
+    
+    def update_location(self):
+        if not self.text:
+            return
+        
+        if self.bottom < self.height:
+            # Y Scroll
+            self.bottom += 2
+            self.ypos -= 2
+
+        elif self.text.width >= self.width:
+            # Y scrolling
+            self.left += 1
+            if self.right < self.text.width:
+                self.right += 1
+
+            if self.right <= self.left:
+                # Scroll finished
+                self.reset()
+        return
+    
+class NextService(snapshot):
+    def __init__(self, font, mode, data=None, headcodes=False):
+        super(NextService, self).__init__(256, 12, None, 0.04)
+
+        self.font = font
+        self.mode = mode
+        self.headcodes = headcodes
+        self.buffer = Image.new(mode, self.size)
+
+        self.rendered_data = None
+        self.text = None
+        self.changed = False
+
+        if data:
+            self.update_data(data)
+    
+    def reset(self):
+        if not self.text:
+            return
+        
+        self.ypos = self.height
+        self.bottom = 0
+        self.last_updated = time.monotonic()
+    
+    def update_data(self, data):
+        if data == self.rendered_data:
+            return
+
+        # The same train, eg: with a new status, is redrawn where it is
+        # rather than scrolling in again
+        in_place = self.text is not None and data and self.rendered_data and data["rid"] == self.rendered_data["rid"]
+        previous = self.rendered_data
+        self.rendered_data = data
+
+        if in_place:
+            if not changed_fields(previous, data) & ROW_FIELDS:
+                return
+
+            self.text.paste(0, (0, 0, self.width, self.height))
+            render_departure(self.text, self.font, 1, data, headcodes=self.headcodes)
+            self.changed = True
+            return
+
+        if self.text:
+            del self.text
+        
+        self.text = Image.new(self.mode, self.size)
+        render_departure(self.text, self.font, 1, data, headcodes=self.headcodes)
+
+        self.changed = False
+        self.reset()
+
+    def compose(self, image, xy):
+        self.buffer.paste(0, (0, 0, self.width, self.height))
+        self.buffer.paste(self.text, (0, self.ypos))
+        image.paste(self.buffer, xy)
+    
+    def paste_into(self, image, xy):
+        if self.changed and self.text and not super(NextService, self).should_redraw():
+            # Show the change without moving the scroll on
+            self.changed = False
+            self.compose(image, xy)
+            return
+
+        self.changed = False
+        pause = 0
+
+        if self.text:
+            if self.bottom < self.height:
+                # Y Scroll
+                self.bottom += 2
+                self.ypos -= 2
+            else:
+                # Pause rendering for a minute
+                pause = 60
+
+            self.compose(image, xy)
+
+        self.last_updated = time.monotonic() + pause
+    
+    def should_redraw(self):
+        if not self.text:
+            return False
+        
+        return self.changed or super(NextService, self).should_redraw()
+
+    def set_headcodes(self, headcodes):
+        if headcodes == self.headcodes:
+            return
+
+        self.headcodes = headcodes
+        self.rendered_data = None
+
+    def get_deadline(self):
+        if not self.text:
+            return None
+        if self.changed:
+            return time.monotonic()
+
+        return self.last_updated + self.interval
+
+class RemainingServices(snapshot):
+    def __init__(self, font, mode, data=None, headcodes=False):
+        super(RemainingServices, self).__init__(256, 12, None, 0.04)
+
+        self.font = font
+        self.mode = mode
+        self.headcodes = headcodes
+        self.buffer = Image.new(mode, self.size)
+
+        self.rendered_data = None
+        self.text = None
+        self.changed = False
+
+        if data:
+            self.update_data(data)
+    
+    def reset(self):
+        if not self.text:
+            return
+        
+        self.ypos = self.height
+        self.bottom = 0
+        self.top = 0
+        self.ystart = 0
+
+        self.last_updated = time.monotonic()
+    
+    def update_data(self, data):
+        if data == self.rendered_data:
+            return
+
+        diff = DepartureDiff(self.rendered_data, data)
+        previous = self.rendered_data
+        self.rendered_data = data
+        if not data:
+            return
+
+        if self.text and previous and diff.same_services:
+            # Only the rows with changes we draw are redrawn, and we keep
+            # scrolling from where we were
+            redraw = set(rid for rid, fields in diff.changed.items() if fields & ROW_FIELDS)
+            for i, departure in enumerate(data):
+                if departure["rid"] in redraw:
+                    self.render_row(i + 1, departure, i + 2)
+            if data[0]["rid"] in redraw:
+                self.render_row(len(data) + 1, data[0], 2)
+            if redraw:
+                self.changed = True
+            return
+
+        if self.text:
+            del self.text
+        
+        self.text = Image.new(self.mode, (self.width, (len(data) + 2) * 12))
+        i = 1
+        for departure in data:
+            render_departure(self.text, self.font, i + 1, departure, ypos=12 * i, headcodes=self.headcodes)
+            i += 1
+        
+        # Render last item again for easier scrolling
+        render_departure(self.text, self.font, 2, data[0], 12 * i, headcodes=self.headcodes)
+
+        self.changed = False
+        self.reset()
+
+    def render_row(self, row, departure, order):
+        self.text.paste(0, (0, 12 * row, self.width, 12 * (row + 1)))
+        render_departure(self.text, self.font, order, departure, ypos=12 * row, headcodes=self.headcodes)
+
+    def compose(self, image, xy):
+        self.buffer.paste(0, (0, 0, self.width, self.height))
+        self.buffer.paste(self.text, (0, self.ypos - self.top))
+        image.paste(self.buffer, xy)
+    
+    def paste_into(self, image, xy):
+        if self.changed and self.text and not super(RemainingServices, self).should_redraw():
+            # Show the change without moving the scroll on
+            self.changed = False
+            self.compose(image, xy)
+            return
+
+        self.changed = False
+        pause = 0
+
+        if self.text:
+            self.update_location()
+            if self.top > 0 and self.top % 12 == 0:
+                pause = 5
+
+            self.compose(image, xy)
+
+            if self.bottom >= self.text.height:
+                # We've hit the bottom
+                self.top = 12
+                self.bottom = 24
+
+        self.last_updated = time.monotonic() + pause
+    
+    def should_redraw(self):
+        if not self.text:
+            return False
+        
+        return self.changed or super(RemainingServices, self).should_redraw()
+
+    def set_headcodes(self, headcodes):
+        if headcodes == self.headcodes:
+            return
+
+        self.headcodes = headcodes
+        self.rendered_data = None
+
+    def get_deadline(self):
+        if not self.text:
+            return None
+        if self.changed:
+            return time.monotonic()
+
+        return self.last_updated + self.interval
+    
+    def update_location(self):
+        if not self.text:
+            return
+        
+        if self.ypos > 0:
+            # We're scrolling up our initial scroll
+            self.ypos -= 2
+            self.bottom += 2
+        else:
+            self.top += 2
+            self.bottom += 2
+
+
+def render_departure(image, font, order=1, departure=None, ypos=0, headcodes=False):
+    if not departure:
+        return
+    
+    # Order: Left
+    font.draw(image, (0, ypos), utils.ordinal(order))
+
+    # Scheduled: Center
+    align = utils.align(font, departure["scheduled"], 28, "center")
+    font.draw(image, (17 + align, ypos), departure["scheduled"])
+
+    # Headcode: Optional
+    xpos = 0
+    if headcodes:
+        xpos += 27
+        align = utils.align(font, departure["headcode"], 27, "center")
+        font.draw(image, (45 + align, ypos), departure["headcode"])
+
+    # Platform: Center
+    align = utils.align(font, departure["platform"], 19, "center")
+    font.draw(image, (45 + align + xpos, ypos), departure["platform"])
+
+    # Destination: Left
+    font.draw(image, (64 + xpos, ypos), departure["destination"]["abbr_name"])
+
+    # Status: Right
+    align = utils.align(font, departure["status"], 40, "right")
+    font.draw(image, (216 + align, ypos), departure["status"])
+    
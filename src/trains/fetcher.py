@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+# Latency of recent fetches, in seconds
+class FetchStats:
+    def __init__(self):
+        self.fetches = 0
+        self.errors = 0
+        self.last = 0.0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    def record(self, latency, error=False):
+        self.fetches += 1
+        if error:
+            self.errors += 1
+
+        self.last = latency
+        self.total += latency
+        self.slowest = max(self.slowest, latency)
+
+    def average(self):
+        if not self.fetches:
+            return 0.0
+        return self.total / self.fetches
+
+
+# Fetches the board on its own asyncio event loop, in a thread alongside the
+# render loop. Fetches are scheduled against the monotonic clock so they
+# don't drift, and the blocking request runs in a single worker thread.
+class Fetcher:
+    def __init__(self, api, frequency, on_state, on_error=None, policy=None, on_config=None):
+        self.api = api
+        self.frequency = frequency
+        self.policy = policy
+        self.on_state = on_state
+        self.on_error = on_error
+        self.on_config = on_config
+        self.stats = FetchStats()
+
+        # A new config and the paths that changed, waiting for the fetch
+        # thread to apply them
+        self.pending_config = None
+        self.pending_lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fetch")
+        self.loop = None
+        self.task = None
+        self.changed = None
+        self.thread = None
+        self.started = threading.Event()
+
+    def interval(self):
+        if not self.frequency or not self.policy:
+            return self.frequency
+        return self.policy.interval(datetime.now())
+
+    def apply_config(self, config, changed=None):
+        # Called from the config thread. The Api and policy are in use on
+        # the fetch thread, so it's applied there before the next fetch,
+        # which this wakes up to make.
+        changed = changed or set()
+        with self.pending_lock:
+            if self.pending_config is not None:
+                changed = self.pending_config[1] | changed
+            self.pending_config = (config, changed)
+
+        self.set_frequency(config.debug.frequency)
+
+    def update_config(self):
+        with self.pending_lock:
+            pending = self.pending_config
+            self.pending_config = None
+        if pending is None:
+            return None
+
+        config, changed = pending
+        self.api.apply_config(config, changed)
+        if self.policy:
+            self.policy.apply_config(config)
+        if self.on_config:
+            self.on_config(config)
+        return config
+
+    def fetch(self):
+        self.update_config()
+        return self.api.get_state()
+
+    async def fetch_once(self):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        try:
+            state = await loop.run_in_executor(self.executor, self.fetch)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.stats.record(time.monotonic() - start, error=True)
+            if self.policy:
+                self.policy.record_error()
+            if self.on_error:
+                self.on_error(ex)
+            return None
+
+        self.stats.record(time.monotonic() - start)
+        if self.policy:
+            self.policy.record(state)
+        self.on_state(state)
+        return state
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.changed = asyncio.Event()
+        self.started.set()
+
+        due = loop.time()
+        while True:
+            self.changed.clear()
+
+            timeout = None
+            if self.interval():
+                await self.fetch_once()
+
+                # Schedule from when the fetch was due rather than when it
+                # finished, skipping any we've missed rather than bunching up
+                due = max(due + self.interval(), loop.time())
+                timeout = due - loop.time()
+
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                continue
+
+            # The frequency changed, or we were asked to refresh
+            due = loop.time()
+
+    def main(self):
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.run())
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.close()
+
+    def start(self):
+        if self.thread:
+            return
+
+        self.thread = threading.Thread(target=self.main, name="fetcher", daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def set_frequency(self, frequency):
+        self.frequency = frequency
+        if self.loop and self.changed and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.changed.set)
+
+    def refresh(self):
+        # Fetch now rather than waiting for the next one to be due
+        self.set_frequency(self.frequency)
+
+    def stop(self, timeout=None):
+        # The loop is closed once the task has finished
+        if self.loop and self.task and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        if self.thread:
+            self.thread.join(timeout)
+
+        # A request in flight is bounded by its own timeouts
+        self.executor.shutdown(wait=False)
+        self.api.close()
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+DAY = 24 * 60 * 60
+
+
+# Seconds since midnight of a fixed format "HH:MM:SS" time
+def parse_clock(clock):
+    return int(clock[0:2]) * 3600 + int(clock[3:5]) * 60 + int(clock[6:8])
+
+# Seconds from midnight on the service's start date to when it departs us.
+# Times are wall clock times, so a service that started before midnight and
+# reaches us after it departs the next day.
+def departure_offset(origin, departs):
+    origin = parse_clock(origin)
+    departs = parse_clock(departs)
+    if origin > departs:
+        departs += DAY
+    return departs
+
+
+# The board settings compiled into a chain of checks on a raw departure.
+# Only the checks that the settings need are in the chain, so the cost of
+# filtering doesn't depend on how the board is configured.
+class DepartureFilter:
+    def __init__(self, settings, now=None):
+        self.platforms = frozenset(settings.platforms)
+        self.tocs = frozenset(settings.tocs)
+        self.destination = settings.destination
+        self.destinations = None
+
+        self.cutoff = (now or datetime.now()) + timedelta(hours=settings.cutoff)
+        # Seconds after midnight on each service start date that we cut off at
+        self.limits = {}
+
+        self.checks = []
+        if self.platforms:
+            self.checks.append(self.on_platform)
+        if self.tocs:
+            self.checks.append(self.run_by_toc)
+        self.checks.append(self.not_departed)
+        self.checks.append(self.before_cutoff)
+
+    def set_lookup(self, lookup):
+        tiploc = lookup.crs_to_tiploc(self.destination) if self.destination else None
+        self.destinations = frozenset((tiploc,)) if tiploc else frozenset()
+
+        # Checking the calling points is cheaper than working out the time
+        if self.destination and self.calls_at not in self.checks:
+            self.checks.insert(self.checks.index(self.before_cutoff), self.calls_at)
+
+    def limit(self, ssd):
+        if ssd not in self.limits:
+            year, month, day = ssd.split("-")
+            self.limits[ssd] = (self.cutoff - datetime(int(year), int(month), int(day))).total_seconds()
+        return self.limits[ssd]
+
+    def on_platform(self, departure):
+        return departure["location"]["forecast"]["plat"]["plat"] in self.platforms
+
+    def run_by_toc(self, departure):
+        return departure["toc"] in self.tocs
+
+    def not_departed(self, departure):
+        return not departure["location"]["forecast"].get("departed")
+
+    def before_cutoff(self, departure):
+        offset = departure_offset(departure["origin"]["timetable"]["time"], departure["location"]["displaytime"])
+        return offset < self.limit(departure["ssd"])
+
+    def calls_at(self, departure):
+        # Whether it calls at our destination, if we have one
+        if not self.destination:
+            return True
+        if not departure["calling"] or not self.destinations:
+            return False
+
+        destinations = self.destinations
+        for stop in departure["calling"]:
+            if stop["tpl"] in destinations:
+                return True
+        return False
+
+    def __call__(self, departure):
+        for check in self.checks:
+            if not check(departure):
+                return False
+        return True
@@ -0,0 +1,153 @@
+import math
+import os
+import pickle
+import string
+import threading
+
+import PIL
+from PIL import Image, ImageDraw
+
+from trains.utils import cache_path, write_atomic
+
+# Rasterised ahead of time, anything else is rasterised when first used
+PRELOAD = string.digits + string.ascii_letters + string.punctuation + " "
+
+def measure(font, char):
+    # Pillow 8 added getlength and getbbox, Pillow 10 removed getsize
+    if hasattr(font, "getlength"):
+        return int(font.getlength(char)), font.getbbox(char)[3]
+    return font.getsize(char)
+
+# Pre-rasterised glyphs for one of our dot matrix fonts. These are bitmap
+# style fonts with whole pixel advances and no kerning, so rendering a
+# string is the same as blitting each glyph at the sum of the advances
+# before it. It behaves enough like a PIL font for measuring text.
+class GlyphAtlas:
+    def __init__(self, font, persist=True):
+        self.font = font
+        self.glyphs = {}
+        # Atlases are shared between panels, which rasterise glyphs they
+        # haven't seen from their own threads
+        self.lock = threading.Lock()
+        ascent, descent = font.getmetrics()
+        self.height = ascent + descent
+
+        # Pillow uses the bottom of "A" plus the spacing between lines
+        self.line_height = self.glyph("A")[1]
+
+        self.path = None
+        if persist:
+            self.path = cache_path("glyphs/{0}-{1}.pickle".format(os.path.basename(font.path), font.size))
+
+        if not self.load():
+            for char in PRELOAD:
+                self.glyph(char)
+            self.save()
+
+    def load(self):
+        if not self.path:
+            return False
+
+        try:
+            with open(self.path, "rb") as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+
+        if cached.get("version") != PIL.__version__ or cached.get("height") != self.height:
+            return False
+
+        for char, (advance, bottom, data) in cached["glyphs"].items():
+            bitmap = None
+            if data is not None:
+                bitmap = Image.frombytes("1", (advance, self.height), data)
+            self.glyphs[char] = (advance, bottom, bitmap)
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+
+        glyphs = {}
+        for char, (advance, bottom, bitmap) in self.glyphs.items():
+            glyphs[char] = (advance, bottom, bitmap.tobytes() if bitmap else None)
+
+        try:
+            write_atomic(self.path, pickle.dumps({"version": PIL.__version__, "height": self.height, "glyphs": glyphs}))
+        except OSError:
+            return
+
+    def glyph(self, char):
+        if char in self.glyphs:
+            return self.glyphs[char]
+
+        with self.lock:
+            # Another thread may have rasterised it while we waited
+            if char in self.glyphs:
+                return self.glyphs[char]
+
+            advance, bottom = measure(self.font, char)
+
+            bitmap = None
+            if advance > 0:
+                bitmap = Image.new("1", (advance, self.height))
+                ImageDraw.Draw(bitmap).text((0, 0), char, font=self.font, fill=255)
+                if not bitmap.getbbox():
+                    bitmap = None
+
+            self.glyphs[char] = (advance, bottom, bitmap)
+            return self.glyphs[char]
+
+    def getlength(self, text):
+        glyphs = self.glyphs
+        width = 0
+        for char in text:
+            width += (glyphs[char] if char in glyphs else self.glyph(char))[0]
+        return width
+
+    def getsize(self, text):
+        glyphs = self.glyphs
+        width = 0
+        height = 0
+        for char in text:
+            advance, bottom, _ = glyphs[char] if char in glyphs else self.glyph(char)
+            width += advance
+            if bottom > height:
+                height = bottom
+        return (width, height)
+
+    def getsize_multiline(self, text, spacing=4):
+        lines = text.split("\n")
+        width = max(self.getlength(line) for line in lines)
+        return (width, len(lines) * (self.line_height + spacing) - spacing)
+
+    def draw(self, image, xy, text, fill=255, align="left", spacing=4):
+        if not text:
+            return
+
+        if "\n" not in text:
+            return self.draw_line(image, xy, text, fill)
+
+        lines = text.split("\n")
+        widths = [self.getlength(line) for line in lines]
+        max_width = max(widths)
+
+        left, top = xy
+        for line, width in zip(lines, widths):
+            xpos = left
+            if align == "center":
+                xpos += math.floor((max_width - width) / 2)
+            elif align == "right":
+                xpos += max_width - width
+
+            self.draw_line(image, (xpos, top), line, fill)
+            top += self.line_height + spacing
+
+    def draw_line(self, image, xy, text, fill=255):
+        glyphs = self.glyphs
+        x, y = int(xy[0]), int(xy[1])
+        for char in text:
+            advance, _, bitmap = glyphs[char] if char in glyphs else self.glyph(char)
+            if bitmap:
+                image.paste(fill, (x, y, x + advance, y + self.height), bitmap)
+            x += advance
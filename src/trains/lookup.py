@@ -0,0 +1,71 @@
+from trains.data import Location
+
+
+# Lookup tables for a single board response. These are indexed once when the
+# response is parsed rather than scanned for every departure and stop.
+class Lookup:
+    def __init__(self, data, replacements=None):
+        self.replacements = replacements
+        self.tiplocs = data["tiploc"] if data.get("tiploc") else {}
+
+        self.tocs = {}
+        if data.get("toc"):
+            for code, toc in data["toc"].items():
+                self.tocs[code] = toc["tocname"]
+
+        self.crs = {}
+        for tiploc, station in self.tiplocs.items():
+            if "crs" not in station:
+                continue
+
+            # The first TIPLOC for a CRS wins
+            if station["crs"] not in self.crs:
+                self.crs[station["crs"]] = tiploc
+
+        self.reasons = {}
+        reasons = data["reasons"] if data.get("reasons") else {}
+        for reason_type in ("cancelled", "late"):
+            self.reasons[reason_type] = {}
+            if not reasons.get(reason_type):
+                continue
+
+            for code, reason in reasons[reason_type].items():
+                self.reasons[reason_type][str(code)] = reason["reasontext"]
+
+        self.locations = {}
+
+    def crs_to_tiploc(self, crs):
+        if crs not in self.crs:
+            return None
+        return self.crs[crs]
+
+    def toc_name(self, toc):
+        if toc not in self.tocs:
+            return None
+        return self.tocs[toc]
+
+    def reason(self, reason_type, code):
+        if not code:
+            return None
+
+        reasons = self.reasons[reason_type]
+        if str(code) not in reasons:
+            return None
+        return reasons[str(code)]
+
+    def location(self, tiploc):
+        if tiploc in self.locations:
+            return self.locations[tiploc]
+
+        data = self.tiplocs[tiploc]
+
+        location = Location(
+            name=data["locname"],
+            crs=data.get("crs"),
+            toc=data.get("toc"),
+            toc_name=self.toc_name(data.get("toc")),
+            abbr_name=Location.abbreviate(data["locname"], self.replacements),
+        )
+
+        self.locations[tiploc] = location
+        return location
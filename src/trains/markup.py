@@ -0,0 +1,35 @@
+import html
+import re
+from html.entities import html5
+
+# Tags, with quoted attributes that may contain ">", and comments
+TAG = re.compile(r"<(?:/?[A-Za-z](?:[^>\"']|\"[^\"]*\"|'[^']*')*|!--.*?--)>", re.S)
+ENTITY = re.compile(r"&(#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);")
+# Elements whose content isn't text, which we leave to BeautifulSoup
+RAW_TEXT = re.compile(r"<(?:script|style|textarea|title)\b", re.I)
+
+
+def well_formed(text):
+    # Every "&" starts a complete entity that we know
+    entities = 0
+    for match in ENTITY.finditer(text):
+        name = match.group(1)
+        if name[0] != "#" and name + ";" not in html5:
+            return False
+        entities += 1
+    return entities == text.count("&")
+
+# The text of a station message. Messages only use a handful of simple tags
+# and entities, so we strip and decode them directly. Anything unusual goes
+# to BeautifulSoup, which is only imported when it's needed.
+def strip_tags(markup):
+    if "<" not in markup and "&" not in markup:
+        return markup
+
+    if not RAW_TEXT.search(markup):
+        text = TAG.sub("", markup)
+        if "<" not in text and well_formed(text):
+            return html.unescape(text)
+
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, features="html.parser").get_text()
@@ -0,0 +1,188 @@
+import threading
+from datetime import datetime
+
+from trains.api import Api
+from trains.board import Board
+from trains.config import compile_config, diff_config
+from trains.fetcher import Fetcher
+from trains.polling import PollingPolicy
+from trains.saved import SavedState
+
+
+# The config for each panel: the main config with the panel's own settings
+# over the top. Without any panels, the main config drives a single display.
+def panel_configs(config):
+    if not config.panels:
+        return [config]
+    return [compile_config(panel, base=config) for panel in config.panels]
+
+# Panels showing the same board share a fetch
+def station_key(config):
+    return (config.settings.departure, config.debug.url)
+
+
+# One display, with its own board, scenes and render thread
+class Panel:
+    def __init__(self, index, config, fonts, serial=None):
+        self.index = index
+        self.config = config
+        self.board = Board(config, serial, fonts, name="Departure Board {0}".format(index + 1))
+
+        self.saved = SavedState(config)
+        restored = self.saved.load()
+        if restored:
+            self.board.restore(*restored)
+        self.board.departure_board()
+
+        # Each panel filters the shared response with its own settings
+        self.api = Api(config)
+        # A new config for the Api and saved board, waiting for the fetch
+        # thread to apply it
+        self.pending_config = None
+        self.pending_lock = threading.Lock()
+
+        self.frames = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def apply_config(self, config):
+        # Called from the config thread. The board applies it on this panel's
+        # render thread, and the Api and saved board on the fetch thread.
+        changed = diff_config(self.config, config)
+        self.config = config
+        self.board.apply_config(config, changed)
+
+        with self.pending_lock:
+            if self.pending_config is not None:
+                changed = self.pending_config[1] | changed
+            self.pending_config = (config, changed)
+
+    def update_config(self):
+        with self.pending_lock:
+            pending = self.pending_config
+            self.pending_config = None
+        if pending is None:
+            return
+
+        config, changed = pending
+        self.api.apply_config(config, changed)
+        self.saved.apply_config(config)
+
+    def update_payload(self, payload):
+        self.update_config()
+        state = self.api.parse_payload(payload)
+        if state is not None:
+            self.board.update_state(state)
+            self.saved.save(state)
+        return state
+
+    def run(self):
+        while not self.stopped.is_set():
+            timestamp = datetime.now()
+            self.board.update_data(timestamp, self.frames)
+            if self.board.render(timestamp, self.frames):
+                self.frames += 1
+            self.board.wait()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="panel-{0}".format(self.index), daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=None):
+        self.stopped.set()
+        self.board.scheduler.notify()
+        if self.thread:
+            self.thread.join(timeout)
+
+
+# Fetches one station once, and parses it for each of the panels showing it.
+# Polling follows the first of those panels.
+class Station(Fetcher):
+    def __init__(self, panels, on_error=None):
+        first = panels[0]
+        super(Station, self).__init__(Api(first.config), first.config.debug.frequency, self.updated, self.failed)
+        self.panels = panels
+        self.payload = None
+        self.station_policy = PollingPolicy(first.config)
+        self.station_error = on_error
+
+    def update_config(self):
+        config = super(Station, self).update_config()
+        if config is not None:
+            self.payload = None
+            self.station_policy.apply_config(config)
+        return config
+
+    def fetch(self):
+        self.update_config()
+        payload = self.api.download(self.api.get_url(), conditional=self.payload is not None)
+        if payload is not None:
+            self.payload = payload
+
+        # Panels skip parsing the same payload again themselves
+        return self.payload
+
+    def interval(self):
+        if not self.frequency:
+            return self.frequency
+        return self.station_policy.interval(datetime.now())
+
+    def updated(self, payload):
+        try:
+            states = [panel.update_payload(payload) for panel in self.panels]
+        except Exception as ex:
+            # A bad payload, eg: an error page, mustn't stop us fetching.
+            # Ask for all of it again next time rather than this copy.
+            self.payload = None
+            self.failed(ex)
+            return
+
+        if states[0] is not None:
+            self.station_policy.record(states[0])
+
+    def failed(self, ex):
+        self.station_policy.record_error()
+        if self.station_error:
+            self.station_error(ex)
+
+
+# Several displays driven from one process, each rendering in its own thread
+# so their SPI transfers overlap. Fonts and their glyph caches are shared.
+class Panels:
+    def __init__(self, config, serials=None, on_error=None):
+        self.fonts = Board.load_fonts()
+
+        self.panels = []
+        for index, panel_config in enumerate(panel_configs(config)):
+            serial = serials[index] if serials else None
+            self.panels.append(Panel(index, panel_config, self.fonts, serial))
+
+        stations = {}
+        for panel in self.panels:
+            stations.setdefault(station_key(panel.config), []).append(panel)
+        self.stations = [Station(panels, on_error) for panels in stations.values()]
+
+    def apply_config(self, config, changed):
+        configs = panel_configs(config)
+        if len(configs) != len(self.panels) or [station_key(c) for c in configs] != [station_key(p.config) for p in self.panels]:
+            # Adding displays or moving them to another station needs a restart
+            print("Panels or their stations changed, restart to apply")
+            return
+
+        for panel, panel_config in zip(self.panels, configs):
+            panel.apply_config(panel_config)
+        for station in self.stations:
+            station.apply_config(station.panels[0].config)
+
+    def start(self):
+        for panel in self.panels:
+            panel.start()
+        for station in self.stations:
+            station.start()
+
+    def stop(self, timeout=None):
+        for station in self.stations:
+            station.stop(timeout)
+        for panel in self.panels:
+            panel.stop(timeout)
+            panel.api.close()
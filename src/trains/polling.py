@@ -0,0 +1,139 @@
+import random
+from datetime import datetime, timedelta
+
+from trains.utils import in_window, seconds_until
+
+# A departure this close, in minutes, is worth watching more closely
+IMMINENT = 2
+
+# Fetches in a row with no changes before we consider the board static
+STATIC_AFTER = 2
+
+# Fetches in a row without delays or platform changes before we consider
+# the board settled again
+SETTLED_AFTER = 5
+
+# Seconds before the display comes back on that we fetch a fresh board
+WAKE_AHEAD = 60
+
+# Cap on how many times we'll double the interval after errors
+MAX_BACKOFF = 6
+
+
+# Whether any departure still on the board has changed, eg: been delayed or
+# moved platform, rather than trains simply leaving and joining the board
+def revised(old, new):
+    if not old:
+        return False
+
+    before = dict((departure["rid"], departure) for departure in old["departures"])
+    for departure in new["departures"]:
+        if departure["rid"] in before and before[departure["rid"]] != departure:
+            return True
+    return False
+
+# When a departure leaves, using its expected time if it's running late
+def minutes_until(departure, now):
+    expected = departure["actual"] or departure["scheduled"]
+    try:
+        hour, minute = expected.split(":")
+        at = now.replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
+    except (AttributeError, ValueError):
+        return None
+
+    # Times are wall clock times, so pick the nearest across midnight
+    if at - now > timedelta(hours=12):
+        at -= timedelta(days=1)
+    elif now - at > timedelta(hours=12):
+        at += timedelta(days=1)
+    return (at - now).total_seconds() / 60
+
+
+# Decides how long to wait before fetching the board again. We poll more
+# often when a train is about to leave or the board is changing, less often
+# when it's static, empty or the display is in powersaving, and back off
+# when the API is failing. While the display is off we barely poll at all.
+class PollingPolicy:
+    def __init__(self, config, rng=None):
+        self.rng = rng or random.Random()
+        self.state = None
+        self.unchanged = 0
+        self.settled = SETTLED_AFTER
+        self.errors = 0
+        self.apply_config(config)
+
+    def apply_config(self, config):
+        debug = config.debug
+        self.frequency = debug.frequency
+        self.adaptive = debug.adaptive
+        self.minimum = min(debug.min_frequency, debug.frequency)
+        self.maximum = max(debug.max_frequency, debug.frequency)
+        self.sleep_frequency = debug.sleep_frequency
+
+        powersaving = config.settings.powersaving
+        self.powersaving_start = powersaving.start
+        self.powersaving_end = powersaving.end
+        # The display is off rather than dimmed
+        self.sleeps = powersaving.brightness == 0
+
+    def record(self, state):
+        self.errors = 0
+        if self.state is not None and state != self.state:
+            self.unchanged = 0
+        else:
+            self.unchanged += 1
+
+        if revised(self.state, state):
+            self.settled = 0
+        else:
+            self.settled += 1
+        self.state = state
+
+    def record_error(self):
+        self.errors += 1
+
+    def next_departure(self, now):
+        if not self.state:
+            return None
+
+        for departure in self.state["departures"]:
+            if departure["cancelled"]:
+                continue
+            minutes = minutes_until(departure, now)
+            if minutes is not None:
+                return minutes
+        return None
+
+    def interval(self, now=None):
+        if not self.frequency or not self.adaptive:
+            return self.frequency
+
+        now = now or datetime.now()
+
+        if self.errors:
+            # Exponential backoff, with jitter so boards don't retry together
+            interval = min(self.frequency * 2 ** min(self.errors, MAX_BACKOFF), self.maximum)
+            return self.rng.uniform(interval / 2, interval)
+
+        interval = self.frequency
+        if in_window(self.powersaving_start, self.powersaving_end, now.time()):
+            if self.sleeps:
+                # Just enough to keep the connection warm, then a fresh
+                # board for when the display comes back on
+                wake = seconds_until(self.powersaving_end, now) - WAKE_AHEAD
+                if wake > 0:
+                    return max(min(self.sleep_frequency, wake), 1)
+            interval = self.maximum
+        elif self.state is not None and not self.state["departures"]:
+            interval = self.frequency * 3
+        elif self.settled < SETTLED_AFTER:
+            # Delays and platform changes tend to come in runs
+            interval = self.frequency / 2
+        else:
+            minutes = self.next_departure(now)
+            if minutes is not None and minutes <= IMMINENT:
+                interval = self.frequency / 2
+            elif self.unchanged >= STATIC_AFTER:
+                interval = self.frequency * 2
+
+        return max(self.minimum, min(interval, self.maximum))
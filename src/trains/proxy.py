@@ -0,0 +1,220 @@
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from trains.api import Api
+from trains.config import compile_config
+from trains.filters import DepartureFilter
+
+# The parts of a departure that boards read, everything else is dropped
+DEPARTURE_FIELDS = {
+    "rid": True,
+    "trainId": True,
+    "toc": True,
+    "ssd": True,
+    "origin": {"tiploc": True, "timetable": {"time": True}},
+    "dest": {"tiploc": True},
+    "location": {
+        "timetable": {"time": True},
+        "displaytime": True,
+        "forecast": {"plat": {"plat": True}, "time": True, "departed": True, "arrived": True},
+        "length": True,
+        "cancelled": True,
+    },
+    "cancelReason": {"reason": True},
+    "lateReason": {"reason": True},
+    "calling": {"tpl": True, "time": True},
+}
+TIPLOC_FIELDS = {"locname": True, "crs": True, "toc": True}
+MESSAGE_FIELDS = {"station": True, "message": True}
+
+BOARD_PATH = re.compile(r"^/boards/([A-Za-z]{3})(?:\?.*)?$")
+
+
+# Keeps only the fields in `fields`, through any lists along the way
+def trim(value, fields):
+    if fields is True:
+        return value
+    if isinstance(value, list):
+        return [trim(item, fields) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: trim(value[key], spec) for key, spec in fields.items() if key in value}
+
+def departure_time(departure):
+    return departure["location"]["timetable"]["time"]
+
+# A board response cut down to what any board could show: departures that
+# haven't left and are within the horizon, earliest first, and only the
+# TIPLOCs that they mention. Boards still apply their own filters to it.
+def compact(data, horizon):
+    settings = compile_config({"settings": {"cutoff": horizon}}).settings
+    departure_filter = DepartureFilter(settings)
+
+    departures = [trim(departure, DEPARTURE_FIELDS) for departure in data.get("departures") or () if departure and departure_filter(departure)]
+    departures.sort(key=departure_time)
+
+    tiplocs = data.get("tiploc") or {}
+    used = set(data.get("station") or ())
+    for departure in departures:
+        used.add(departure["origin"]["tiploc"])
+        used.add(departure["dest"]["tiploc"])
+        for stop in departure.get("calling") or ():
+            used.add(stop["tpl"])
+
+    # Keep the first TIPLOC for each CRS too, so a destination that isn't
+    # called at still resolves the same way on the board
+    seen = set()
+    for tiploc, station in tiplocs.items():
+        if "crs" in station and station["crs"] not in seen:
+            seen.add(station["crs"])
+            used.add(tiploc)
+
+    return {
+        "station": data.get("station"),
+        "departures": departures,
+        "tiploc": {tiploc: trim(station, TIPLOC_FIELDS) for tiploc, station in tiplocs.items() if tiploc in used},
+        "toc": data.get("toc"),
+        "reasons": data.get("reasons"),
+        "messages": trim(data.get("messages") or [], MESSAGE_FIELDS),
+    }
+
+
+# One station's compacted board, ready to send
+class Entry:
+    def __init__(self, payload):
+        self.payload = payload
+        self.compressed = gzip.compress(payload)
+        self.etag = '"{0}"'.format(hashlib.sha1(payload).hexdigest())
+        self.fetched = time.monotonic()
+
+
+# Fetches each station at most once per TTL, however many boards ask for it.
+# Boards asking while a fetch is in flight wait for it rather than making
+# their own.
+class BoardCache:
+    def __init__(self, config):
+        self.config = config
+        self.entries = {}
+        self.apis = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def apply_config(self, config, changed=None):
+        self.config = config
+        with self.lock:
+            for crs, api in self.apis.items():
+                api.apply_config(compile_config({"settings": {"departure": crs}}, base=config), changed)
+
+    def station_lock(self, crs):
+        with self.lock:
+            if crs not in self.locks:
+                self.locks[crs] = threading.Lock()
+                config = compile_config({"settings": {"departure": crs}}, base=self.config)
+                self.apis[crs] = Api(config)
+            return self.locks[crs]
+
+    def fresh(self, entry):
+        return entry is not None and time.monotonic() - entry.fetched < self.config.proxy.ttl
+
+    def get(self, crs):
+        crs = crs.upper()
+        self.requests += 1
+
+        entry = self.entries.get(crs)
+        if self.fresh(entry):
+            return entry
+
+        with self.station_lock(crs):
+            # Someone else may have fetched it while we waited
+            entry = self.entries.get(crs)
+            if self.fresh(entry):
+                return entry
+
+            api = self.apis[crs]
+            self.fetches += 1
+            try:
+                payload = api.download(api.get_url(), conditional=entry is not None)
+            except Exception:
+                self.errors += 1
+                # A stale board is better than none
+                if entry is None:
+                    raise
+                return entry
+
+            if payload is None:
+                # Not modified, so it's fresh again
+                entry.fetched = time.monotonic()
+                return entry
+
+            data = compact(json.loads(payload), self.config.proxy.horizon)
+            entry = Entry(json.dumps(data, separators=(",", ":")).encode())
+            self.entries[crs] = entry
+            return entry
+
+    def close(self):
+        for api in self.apis.values():
+            api.close()
+
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        match = BOARD_PATH.match(self.path)
+        if not match:
+            self.send_error(404)
+            return
+
+        try:
+            entry = self.server.cache.get(match.group(1))
+        except Exception:
+            self.send_error(502)
+            return
+
+        if self.headers.get("If-None-Match") == entry.etag:
+            self.send_response(304)
+            self.send_header("ETag", entry.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        content = entry.payload
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", entry.etag)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            content = entry.compressed
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        return
+
+
+# Serves boards to the other displays on the network, eg: with debug.proxy
+# set to http://this-host:8080 they fetch /boards/{crs} from here
+class ProxyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config):
+        super(ProxyServer, self).__init__((config.proxy.host, config.proxy.port), ProxyHandler)
+        self.cache = BoardCache(config)
+
+    def apply_config(self, config, changed):
+        self.cache.apply_config(config, changed)
+
+    def server_close(self):
+        super(ProxyServer, self).server_close()
+        self.cache.close()
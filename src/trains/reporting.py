@@ -0,0 +1,23 @@
+import threading
+
+DSN = "https://7edfb7e655ea43d7b9cc79b5e75030b9@o406991.ingest.sentry.io/5275445"
+
+sentry = None
+
+
+def init_sentry():
+    global sentry
+
+    import sentry_sdk
+    sentry_sdk.init(DSN)
+    sentry = sentry_sdk
+
+# Sentry is slow to import and set up, so it starts after the first frame
+def start():
+    threading.Thread(target=init_sentry, name="sentry", daemon=True).start()
+
+def capture_exception(ex):
+    if sentry is None:
+        print(ex)
+        return
+    sentry.capture_exception(ex)
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+
+from trains.data import State
+from trains.utils import cache_path, write_atomic
+
+# Seconds between rewriting a board that hasn't changed, to keep its
+# timestamp current without writing to the SD card on every fetch
+REFRESH = 60
+
+
+# The settings that decide what a board shows, so we never restore a board
+# saved for a different station or filters
+def board_key(config):
+    settings = config.settings
+    return json.dumps([
+        settings.departure, settings.destination, settings.platforms, settings.tocs,
+        settings.services, config.replacements, config.debug.url,
+    ], sort_keys=True)
+
+
+# The last board we fetched, kept on disk so that after a restart we can show
+# it straight away instead of the initialising scene
+class SavedState:
+    def __init__(self, config):
+        self.apply_config(config)
+        self.writes = 0
+
+    def apply_config(self, config):
+        self.max_age = config.debug.restore_age
+        self.key = board_key(config)
+        self.path = cache_path("board-{0}.json".format(hashlib.sha1(self.key.encode()).hexdigest()[:12]))
+
+        self.state = None
+        self.saved = 0
+
+    def load(self):
+        # The saved state and when it was saved, if it's recent enough to show
+        if not self.max_age:
+            return None
+
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+            if saved["key"] != self.key:
+                return None
+
+            # A clock behind the save, eg: before NTP has synced, can't be
+            # trusted
+            timestamp = float(saved["saved"])
+            age = time.time() - timestamp
+            if age < 0 or age > self.max_age:
+                return None
+
+            state = State.from_dict(saved["state"])
+            restored = datetime.fromtimestamp(timestamp)
+        except (OSError, ValueError, TypeError, KeyError, AttributeError, OverflowError):
+            # A damaged board is the same as no board
+            return None
+
+        self.state = state
+        self.saved = timestamp
+        return state, restored
+
+    def save(self, state):
+        now = time.time()
+        if state == self.state and now - self.saved < REFRESH:
+            return
+
+        saved = {
+            "key": self.key,
+            "saved": now,
+            "state": state.to_dict(),
+        }
+
+        try:
+            write_atomic(self.path, json.dumps(saved, separators=(",", ":")))
+        except OSError as ex:
+            print("Unable to save the board: {0}".format(ex))
+            return
+
+        self.state = state
+        self.saved = now
+        self.writes += 1
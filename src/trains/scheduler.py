@@ -0,0 +1,35 @@
+import threading
+import time
+from datetime import datetime
+
+
+# Convert a wall clock datetime into a deadline on the time.monotonic() clock
+def monotonic_deadline(timestamp):
+    return time.monotonic() + (timestamp - datetime.now()).total_seconds()
+
+
+# Sleeps the render loop until the earliest hotspot deadline, or until
+# something (eg: new data) wakes it up early.
+class Scheduler:
+    def __init__(self, max_sleep=60):
+        self.max_sleep = max_sleep
+        self.wakeup = threading.Event()
+
+        self.wakeups = 0
+        self.slept = 0.0
+
+    def notify(self):
+        self.wakeup.set()
+
+    def wait_until(self, deadline):
+        timeout = self.max_sleep
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+
+        if timeout > 0:
+            start = time.monotonic()
+            self.wakeup.wait(timeout)
+            self.slept += time.monotonic() - start
+
+        self.wakeup.clear()
+        self.wakeups += 1
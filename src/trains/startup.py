@@ -0,0 +1,38 @@
+import os
+import time
+
+
+# How long the process had been running before we were imported, from its
+# start time in /proc. This covers starting Python itself.
+def process_age():
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces, so count from after it
+            fields = f.read().rsplit(")", 1)[1].split()
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    except (OSError, ValueError, AttributeError, IndexError):
+        return 0.0
+
+
+# Times each phase of startup, for --profile-startup
+class StartupProfile:
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.start = time.perf_counter() - process_age()
+        self.last = self.start
+        self.phases = []
+
+        self.phase("python")
+
+    def phase(self, name):
+        if not self.enabled or name in (phase[0] for phase in self.phases):
+            return
+
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last, now - self.start))
+        self.last = now
+
+    def report(self):
+        for name, took, since in self.phases:
+            print("{0:>14}: {1:8.1f} ms, {2:8.1f} ms since start".format(name, took * 1000, since * 1000))
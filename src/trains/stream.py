@@ -0,0 +1,111 @@
+import codecs
+import json
+
+CHUNK_SIZE = 16384
+
+WHITESPACE = " \t\n\r"
+DELIMITERS = WHITESPACE + ",:]}"
+
+decoder = json.JSONDecoder()
+
+
+def iter_chunks(payload, size=CHUNK_SIZE):
+    view = memoryview(payload)
+    for start in range(0, len(view), size):
+        yield view[start:start + size]
+
+
+# Reads the members of a JSON object from a stream of byte chunks, decoding
+# one value at a time rather than the whole document. The items of arrays
+# named in `arrays` are yielded one by one as they arrive, so the caller
+# never needs to hold the whole array.
+class StreamDecoder:
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        if self.exhausted:
+            return False
+
+        # Drop what we've already decoded so the buffer stays small
+        if self.pos > CHUNK_SIZE:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+
+        try:
+            chunk = next(self.chunks)
+        except StopIteration:
+            self.exhausted = True
+            self.buffer += self.utf8.decode(b"", final=True)
+            return False
+
+        self.buffer += self.utf8.decode(bytes(chunk))
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of JSON")
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("Expected {0!r} at {1!r}".format(chars, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                value, end = None, None
+
+            # A number may carry on in the next chunk, so we only trust a
+            # value once we've seen what follows it
+            if end is not None and (self.exhausted or (end < len(self.buffer) and self.buffer[end] in DELIMITERS)):
+                self.pos = end
+                return value
+
+            if self.exhausted:
+                raise ValueError("Invalid JSON at {0!r}".format(self.buffer[self.pos:self.pos + 20]))
+
+            # Wait until we have twice as much before trying again, so a
+            # large value isn't re-scanned for every chunk
+            needed = 2 * (len(self.buffer) - self.pos)
+            while len(self.buffer) - self.pos < needed and self.fill():
+                pass
+
+    def members(self, arrays=()):
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            key = self.value()
+            self.expect(":")
+
+            if key in arrays and self.peek() == "[":
+                self.pos += 1
+                if self.peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.value()
+                        if self.expect(",]") == "]":
+                            break
+            else:
+                yield key, self.value()
+
+            if self.expect(",}") == "}":
+                return
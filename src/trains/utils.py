@@ -1,79 +1,137 @@
-import math
-import socket
-
-from getmac import get_mac_address
-
-try:
-    import cv2
-    import numpy
-except ImportError:
-    pass
-
-def wordwrap(font, width, input):
-    words = input.split()
-    lines = []
-    line = ""
-
-    while words:
-        word = words.pop(0)
-        newline = line + " " + word
-        if font.getsize_multiline(newline.strip())[0] > width:
-            # Text is too wide, wrap
-            if line:
-                # We have a full line
-                lines.append(line.strip())
-                line = word
-            else:
-                # Line was empty, let's just overflow
-                lines.append(newline.strip())
-                line = ""
-        else:
-            line = newline
-
-    if line:
-        lines.append(line)
-    return lines
-
-def ordinal(number):
-    number = int(number)
-    suffix = ['th', 'st', 'nd', 'rd', 'th'][min(number % 10, 4)]
-    if 11 <= (number % 100) <= 13:
-        suffix = 'th'
-    return str(number) + suffix
-
-def align(font, text, width, align="center"):
-    if not text:
-      return 0
-    
-    text_width = font.getsize_multiline(text)[0]
-    if align == "center":
-        return max(math.floor((width - text_width) / 2), 0)
-    elif align == "right":
-        return max(width - text_width, 0)
-    else:
-        return 0
-
-def display_image(name, image):
-    if not numpy and cv2:
-        return
-    
-    if not image.width or not image.height:
-        return
-    
-    if image.mode != "RGB":
-        image = image.convert("RGB")
-    
-    np_image = numpy.array(image)
-    np_image = cv2.cvtColor(np_image, cv2.COLOR_RGB2BGR)
-    np_image = cv2.resize(np_image, None, fx = 2, fy = 2, interpolation = cv2.INTER_AREA)
-    cv2.imshow(name, np_image)
-    cv2.waitKey(1)
-
-def get_ip_address():
-    return socket.gethostbyname(socket.gethostname())
-
-def get_device_id():
-    # We need a unique device ID for config, etc. Let's use MAC address.
-    mac = get_mac_address()
-    
+import functools
+import math
+import os
+import socket
+from datetime import timedelta
+
+def wordwrap(font, width, input):
+    # Our fonts have no kerning, so a line is as wide as its words plus the
+    # spaces between them and we only need to measure each word once
+    space = font.getlength(" ")
+    lines = []
+    line = []
+    line_width = 0
+
+    for word in input.split():
+        word_width = font.getlength(word)
+        new_width = line_width + space + word_width if line else word_width
+        if new_width > width:
+            # Text is too wide, wrap
+            if line:
+                # We have a full line
+                lines.append(" ".join(line))
+                line = [word]
+                line_width = word_width
+            else:
+                # Line was empty, let's just overflow
+                lines.append(word)
+        else:
+            line.append(word)
+            line_width = new_width
+
+    if line:
+        lines.append(" ".join(line))
+    return lines
+
+# Wrapped pages of a message. Station messages persist for hours, so these
+# are cached rather than re-wrapped every time the state changes.
+@functools.lru_cache(maxsize=128)
+def paginate(font, width, text, lines=3):
+    wrapped = wordwrap(font, width, text)
+
+    pages = []
+    for start in range(0, len(wrapped), lines):
+        pages.append("\n".join(wrapped[start:start + lines]))
+    return tuple(pages)
+
+# Whether a time of day falls in a window, which may span midnight
+def in_window(start, end, now):
+    if not start or not end:
+        return False
+
+    if start <= end:
+        # eg: 00:00 - 07:00
+        return start <= now < end
+
+    # eg: 22:00 - 06:00
+    return now >= start or now < end
+
+# Seconds from now until a time of day next comes round
+def seconds_until(clock, now):
+    at = now.replace(hour=clock.hour, minute=clock.minute, second=0, microsecond=0)
+    if at <= now:
+        at += timedelta(days=1)
+    return (at - now).total_seconds()
+
+def ordinal(number):
+    number = int(number)
+    suffix = ['th', 'st', 'nd', 'rd', 'th'][min(number % 10, 4)]
+    if 11 <= (number % 100) <= 13:
+        suffix = 'th'
+    return str(number) + suffix
+
+def align(font, text, width, align="center"):
+    if not text:
+      return 0
+    
+    text_width = font.getsize_multiline(text)[0]
+    if align == "center":
+        return max(math.floor((width - text_width) / 2), 0)
+    elif align == "right":
+        return max(width - text_width, 0)
+    else:
+        return 0
+
+@functools.lru_cache(maxsize=None)
+def preview_modules():
+    # OpenCV and NumPy are slow to import, so wait until we need a preview
+    try:
+        import cv2
+        import numpy
+    except ImportError:
+        return None
+    return cv2, numpy
+
+def display_image(name, image):
+    modules = preview_modules()
+    if not modules:
+        return
+    cv2, numpy = modules
+    
+    if not image.width or not image.height:
+        return
+    
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    np_image = numpy.array(image)
+    np_image = cv2.cvtColor(np_image, cv2.COLOR_RGB2BGR)
+    np_image = cv2.resize(np_image, None, fx = 2, fy = 2, interpolation = cv2.INTER_AREA)
+    cv2.imshow(name, np_image)
+    cv2.waitKey(1)
+
+def cache_path(name):
+    # Somewhere to keep files between runs
+    cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache, "departure-board", name)
+
+def write_atomic(path, data):
+    # Write to a temporary file and rename it over the old one, so a crash or
+    # power cut never leaves us half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = "{0}.tmp".format(path)
+    with open(temp, "wb" if isinstance(data, bytes) else "w") as f:
+        f.write(data)
+    os.replace(temp, path)
+
+def get_ip_address():
+    return socket.gethostbyname(socket.gethostname())
+
+@functools.lru_cache(maxsize=None)
+def get_device_id():
+    from getmac import get_mac_address
+
+    # We need a unique device ID for config, etc. Let's use MAC address.
+    mac = get_mac_address()
+    
     return mac.replace(":", "")
\ No newline at end of file